@@ -17,24 +17,6 @@ COLOR_TEXTO = "#FFFFFF"          # Blanco
 FUENTE_TITULO = ("Segoe UI", 16, "bold")
 FUENTE_BOTON = ("Segoe UI", 12)
 
-#  Visualizar ventana principal
-ventana = tk.Tk()
-ventana.title("Menú Principal")
-ventana.geometry("400x300")
-ventana.configure(bg=COLOR_FONDO)
-
-# Frame centralizado
-frame = tk.Frame(ventana, bg=COLOR_FONDO)
-frame.pack(expand=True)
-
-# Comentario de bienvenida
-etiqueta = tk.Label(frame,
-                    text="Selecciona una aplicación",
-                    font=FUENTE_TITULO,
-                    fg=COLOR_TEXTO,
-                    bg=COLOR_FONDO)
-etiqueta.pack(pady=(10, 20))
-
 # Funcion de los botones
 def abrir_reconocimiento_facial():
     ModernFaceApp(master=ventana)
@@ -66,19 +48,44 @@ def crear_boton(texto, comando):
                      relief="flat",
                      cursor="hand2")
 
-boton_reconocimiento = crear_boton("Reconocimiento Facial", abrir_reconocimiento_facial)
-boton_reconocimiento.pack(pady=5)
-
-boton_tablas = crear_boton("Tablas Referenciales", abrir_tablas)
-boton_tablas.pack(pady=5)
-
-boton_reportes = crear_boton("Reportes y Dashboards", abrir_reportes)
-boton_reportes.pack(pady=5)
-
 def salir():
     ventana.destroy()
     sys.exit()
 
-if __name__ == "__main__":
+def main():
+    # La ventana se arma sólo al ejecutar app.py: los procesos hijos del ProcessPool de encodings
+    # (spawn en Windows) reimportan este módulo y no deben abrir otra ventana.
+    global ventana, frame
+
+    #  Visualizar ventana principal
+    ventana = tk.Tk()
+    ventana.title("Menú Principal")
+    ventana.geometry("400x300")
+    ventana.configure(bg=COLOR_FONDO)
+
+    # Frame centralizado
+    frame = tk.Frame(ventana, bg=COLOR_FONDO)
+    frame.pack(expand=True)
+
+    # Comentario de bienvenida
+    etiqueta = tk.Label(frame,
+                        text="Selecciona una aplicación",
+                        font=FUENTE_TITULO,
+                        fg=COLOR_TEXTO,
+                        bg=COLOR_FONDO)
+    etiqueta.pack(pady=(10, 20))
+
+    boton_reconocimiento = crear_boton("Reconocimiento Facial", abrir_reconocimiento_facial)
+    boton_reconocimiento.pack(pady=5)
+
+    boton_tablas = crear_boton("Tablas Referenciales", abrir_tablas)
+    boton_tablas.pack(pady=5)
+
+    boton_reportes = crear_boton("Reportes y Dashboards", abrir_reportes)
+    boton_reportes.pack(pady=5)
+
     ventana.protocol("WM_DELETE_WINDOW", salir)
     ventana.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# attendance_writer.py
+# Escritor de asistencias en segundo plano: una sola conexión SQLite de larga duración (WAL,
+# synchronous=NORMAL) alimentada por una cola. Los eventos se agrupan en una transacción por lote,
+# con una latencia máxima acotada (max_latency) antes de escribir. Quien detecta (GUI, cámaras)
+# sólo encola y sigue: nunca espera un commit. Los turnos abiertos se llevan en memoria
+# (utils_db.OpenShifts), así cada detección es un INSERT/UPDATE sin lectura previa.
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from . import utils_db
+
+log = logging.getLogger("attendance_writer")
+
+_STOP = object()
+
+
+class AttendanceWriterError(RuntimeError):
+    pass
+
+
+class AttendanceWriter(threading.Thread):
+    # on_written(evento_registrado, legajo, t) se llama desde el hilo del writer después del commit.
+    # Los eventos que no coinciden con el turno abierto (ver utils_db.empleado_detected) se cuentan
+    # en ignored y no se informan. Si el hilo no puede abrir la base (o muere por un error inesperado)
+    # queda en failed y submit/flush lanzan AttendanceWriterError en vez de encolar para nadie.
+    def __init__(
+        self,
+        db_path: str = utils_db.PYME_DB,
+        max_batch: int = 200,
+        max_latency: float = 0.25,
+        synchronous: str = "NORMAL",
+        on_written: Optional[Callable[[str, int, float], None]] = None,
+    ):
+        super().__init__(daemon=True, name="AttendanceWriter")
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.synchronous = synchronous
+        self.on_written = on_written
+        self.written = 0
+        self.errors = 0
+        self.ignored = 0
+        self.batches = 0
+        self.shifts = utils_db.OpenShifts()
+        self.failed: Optional[BaseException] = None
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def _check(self):
+        if self.failed is not None:
+            raise AttendanceWriterError(f"El writer de asistencias está detenido: {self.failed}") from self.failed
+
+    def submit(self, legajo: int, t: float, evento: Optional[str] = None):
+        self._check()
+        self._queue.put((legajo, t, evento))
+
+    def flush(self, timeout: Optional[float] = None):
+        # Espera a que se escriba todo lo encolado hasta ahora. False si venció el timeout o el hilo
+        # ya no corre; AttendanceWriterError si falló mientras se esperaba
+        self._check()
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not done.wait(0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))):
+            self._check()
+            if not self.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                return done.is_set()
+        return True
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        self._queue.put(_STOP)
+        self.join(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self.shifts.reload(conn.cursor())
+        log.info("Turnos abiertos cargados: %d", len(self.shifts))
+        return conn
+
+    def _collect(self, first):
+        # Junta eventos hasta max_batch o hasta que venza max_latency desde el primero
+        batch, markers, stop = [], [], False
+        item = first
+        deadline = time.monotonic() + self.max_latency
+        while True:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                markers.append(item)
+            else:
+                batch.append(item)
+            if stop or len(batch) >= self.max_batch:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not markers:
+                break
+            try:
+                # Con un flush() pendiente no se espera: sólo se toma lo que ya está en la cola
+                item = self._queue.get(timeout=remaining) if not markers and remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, markers, stop
+
+    def _write(self, conn, batch):
+        results = []
+        cur = conn.cursor()
+        try:
+            self.shifts.sync(cur)  # otra terminal pudo haber escrito desde el último lote
+            with conn:  # una transacción para todo el lote
+                for legajo, t, evento in batch:
+                    results.append((utils_db.empleado_detected(cur, legajo, t, self.shifts, evento), legajo, t))
+        except sqlite3.Error:
+            log.exception("Falló el lote de %d asistencias; se reintenta de a uno", len(batch))
+            results = []
+            self.shifts.reload(cur)  # descartar lo que quedó en memoria del lote deshecho
+            for legajo, t, evento in batch:
+                try:
+                    with conn:
+                        results.append((utils_db.empleado_detected(cur, legajo, t, self.shifts, evento), legajo, t))
+                except sqlite3.Error:
+                    self.errors += 1
+                    log.exception("No se pudo registrar la asistencia del legajo %s", legajo)
+                    self.shifts.reload(cur)
+        self.batches += 1
+        registered = [r for r in results if r[0] is not None]
+        self.ignored += len(results) - len(registered)
+        self.written += len(registered)
+        results = registered
+        if self.on_written is not None:
+            for evento, legajo, t in results:
+                try:
+                    self.on_written(evento, legajo, t)
+                except Exception:
+                    log.exception("Error en on_written")
+
+    def run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            log.exception("No se pudo abrir la base %s: no se van a registrar asistencias", self.db_path)
+            self.failed = e
+            return
+        try:
+            while True:
+                batch, markers, stop = self._collect(self._queue.get())
+                if batch:
+                    self._write(conn, batch)
+                for marker in markers:
+                    marker.set()
+                if stop:
+                    break
+        except Exception as e:
+            log.exception("El writer de asistencias se detuvo por un error inesperado")
+            self.failed = e
+        finally:
+            conn.close()
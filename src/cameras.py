@@ -0,0 +1,265 @@
+# cameras.py
+# Varias cámaras (una por puerta) alimentando un único pool de workers de reconocimiento.
+# Cada stream tiene su propio RecognitionPipeline (captura + latest-frame-wins), su propio
+# PresenceManager y sus contadores; la detección/encoding de todos se despacha al mismo pool,
+# dimensionado a la cantidad de CPUs. Sin dependencias de Tk: sirve para el modo headless.
+
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import cv2
+
+from . import utils_recognition as u_rec
+from .presence import PresenceManager
+from .recognition_pipeline import (
+    KEYFRAME_INTERVAL, AdaptiveScheduler, FrameRecognizer, MotionGate, RecognitionPipeline,
+)
+
+
+def parse_source(source):
+    # "0", "1", ... -> índice de dispositivo; cualquier otra cosa es un archivo de video o URL (rtsp://, http://)
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def is_video_file(source):
+    # Archivo local: ni índice de dispositivo ni URL de stream
+    source = parse_source(source)
+    return isinstance(source, str) and "://" not in source
+
+
+def open_capture(source):
+    cap = cv2.VideoCapture(parse_source(source))
+    if not cap.isOpened():
+        cap.release()
+        raise RuntimeError(f"No se pudo abrir la fuente de video: {source}")
+    return cap
+
+
+def make_recognition_pool(kind="thread", workers=None):
+    # Un solo pool compartido por todas las cámaras
+    workers = workers or os.cpu_count() or 1
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recognition")
+    raise ValueError(f"Tipo de pool desconocido: {kind} (opciones: thread, process)")
+
+
+@dataclass
+class StreamStats:
+    name: str
+    frames_captured: int = 0
+    frames_processed: int = 0
+    frames_dropped: int = 0
+    frames_gated: int = 0  # procesados sin detección porque no hubo movimiento
+    keyframes: int = 0  # frames con detección completa; el resto se siguió con el tracker
+    latency_ms: float = 0.0  # promedio exponencial por frame procesado
+    interval_ms: float = 0.0  # espera actual entre frames procesados (AdaptiveScheduler)
+    faces_seen: int = 0
+    matches: int = 0
+    uptime: float = 0.0
+
+    @property
+    def capture_fps(self):
+        return self.frames_captured / self.uptime if self.uptime > 0 else 0.0
+
+    @property
+    def processed_fps(self):
+        return self.frames_processed / self.uptime if self.uptime > 0 else 0.0
+
+
+class CameraStream:
+    def __init__(self, name, source, recognizer: FrameRecognizer, presence: PresenceManager,
+                 scheduler: Optional[AdaptiveScheduler] = None, every_frame=False):
+        self.name = name
+        self.source = source
+        self.every_frame = every_frame  # sólo en archivos de video: procesar todos los frames
+        self.recognizer = recognizer
+        self.presence = presence
+        self.scheduler = scheduler if scheduler is not None else AdaptiveScheduler()
+        self.pipeline: Optional[RecognitionPipeline] = None
+        self.started_at = None
+        self.stopped_at = None
+        self._faces_seen = 0
+        self._matches = 0
+
+    def start(self):
+        self.pipeline = RecognitionPipeline(open_capture(self.source), self.recognizer, self.scheduler,
+                                            video_file=is_video_file(self.source), every_frame=self.every_frame)
+        self.started_at = time.time()
+        self.pipeline.start()
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.stopped_at = time.time()
+
+    @property
+    def ended(self):
+        return self.pipeline is None or self.pipeline.ended
+
+    def poll(self):
+        # Pasa los resultados nuevos al PresenceManager de este stream y vence las ausencias;
+        # devuelve los resultados
+        if self.pipeline is None:
+            return []
+        results = self.pipeline.drain_results()
+        for result in results:
+            if result.face_found:
+                self._faces_seen += 1
+            self._matches += len(result.matches)
+            if result.present:
+                self.presence.detections(result.present, result.timestamp)
+        self.presence.tick(self.pipeline.clock())
+        return results
+
+    def stats(self) -> StreamStats:
+        st = StreamStats(name=self.name, faces_seen=self._faces_seen, matches=self._matches)
+        if self.pipeline is not None:
+            st.frames_captured = self.pipeline.grabber.frames
+            st.frames_processed = self.pipeline.worker.processed
+            st.frames_dropped = self.pipeline.dropped_frames
+            st.keyframes = self.recognizer.keyframes
+            st.frames_gated = self.recognizer.gated
+            st.latency_ms = (self.scheduler.latency or 0.0) * 1000
+            st.interval_ms = self.scheduler.interval * 1000
+            st.uptime = (self.stopped_at or time.time()) - self.started_at
+        return st
+
+
+class CameraManager:
+    # sources: lista de índices / archivos / URLs, o dict nombre -> fuente
+    # on_event(stream_name, evento, legajo, t) se llama por cada entrada/salida de cualquier stream
+    def __init__(
+        self,
+        sources,
+        gallery,
+        on_event: Callable[[str, str, int, float], None],
+        pool=None,
+        tolerance=u_rec.EUCLIDEAN_DISTANCE_TOLERANCE,
+        strategy="min",
+        min_votes=1,
+        max_attempts=3,
+        disappear_seconds=10.0,
+        cooldown_seconds=30.0,
+        tracker="kcf",
+        keyframe_interval=KEYFRAME_INTERVAL,
+        cpu_budget=0.5,
+        idle_budget=0.1,
+        motion="mog2",
+        roi=None,
+        detector=None,
+        every_frame=False,
+    ):
+        # cpu_budget / idle_budget: fracción de un núcleo por stream con y sin actividad (ver AdaptiveScheduler)
+        # motion: "mog2" | "diff" | None (sin filtro); roi: (x0, y0, x1, y1) en fracciones, o dict nombre -> roi
+        # detector: u_rec.FaceDetector compartido por todos los streams (None = HOG por defecto)
+        # every_frame: en fuentes que son archivos de video, procesar todos los frames en vez de
+        # reproducirlos a velocidad real (resultados reproducibles para pruebas)
+        if not isinstance(sources, dict):
+            sources = {f"cam{i}": src for i, src in enumerate(sources)}
+        self._own_pool = pool is None
+        self.pool = pool if pool is not None else make_recognition_pool()
+        self.streams: Dict[str, CameraStream] = {}
+        for name, src in sources.items():
+            recognizer = FrameRecognizer(
+                gallery, tolerance=tolerance, strategy=strategy, min_votes=min_votes,
+                max_attempts=max_attempts, executor=self.pool,
+                tracker=tracker, keyframe_interval=keyframe_interval,
+                motion_gate=MotionGate(motion, roi.get(name) if isinstance(roi, dict) else roi) if motion else None,
+                detector=detector,
+            )
+            presence = PresenceManager(
+                on_event=lambda evento, legajo, t, _name=name: on_event(_name, evento, legajo, t),
+                disappear_seconds=disappear_seconds,
+                cooldown_seconds=cooldown_seconds,
+            )
+            scheduler = AdaptiveScheduler(cpu_budget=cpu_budget, idle_budget=idle_budget)
+            self.streams[name] = CameraStream(name, src, recognizer, presence, scheduler, every_frame=every_frame)
+
+    def presence_snapshot_path(self, state_dir, name):
+        return os.path.join(state_dir, f".presence_{name}.npz")
+
+    def save_presence(self, state_dir):
+        for name, stream in self.streams.items():
+            stream.presence.save_snapshot(self.presence_snapshot_path(state_dir, name))
+
+    def load_presence(self, state_dir, open_shifts=None):
+        # Levanta el snapshot de cada stream; los legajos con turno abierto en la DB que ningún
+        # stream tiene presentes se marcan (warm) en todos, para no repetir su entrada en la puerta
+        # por la que aparezcan. Donde no se los vea se descartan sin emitir salida (ver warm_start).
+        # Devuelve (streams restaurados, legajos marcados desde la DB)
+        restored = sum(
+            stream.presence.load_snapshot(self.presence_snapshot_path(state_dir, name))
+            for name, stream in self.streams.items()
+        )
+        warmed = 0
+        if open_shifts and self.streams:
+            present = set()
+            for stream in self.streams.values():
+                present.update(stream.presence.present())
+            missing = {leg: entrada for leg, entrada in open_shifts.items() if leg not in present}
+            for stream in self.streams.values():
+                stream.presence.warm_start(missing)
+            warmed = len(missing)
+        return restored, warmed
+
+    def set_gallery(self, gallery):
+        for stream in self.streams.values():
+            stream.recognizer.gallery = gallery
+
+    def start(self):
+        started = []
+        try:
+            for stream in self.streams.values():
+                stream.start()
+                started.append(stream)
+        except Exception:
+            for stream in started:
+                stream.stop()
+            raise
+
+    def stop(self):
+        for stream in self.streams.values():
+            stream.stop()
+        if self._own_pool:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def all_ended(self):
+        return all(stream.ended for stream in self.streams.values())
+
+    def poll(self):
+        # {stream: [RecognitionResult]} con lo que llegó desde el último poll
+        return {name: stream.poll() for name, stream in self.streams.items()}
+
+    def stats(self) -> List[StreamStats]:
+        return [stream.stats() for stream in self.streams.values()]
+
+    def run_headless(self, stop_event: Optional[threading.Event] = None, poll_interval=0.05,
+                     on_results: Optional[Callable[[str, list], None]] = None):
+        # Loop sin interfaz: corre hasta que se pida parar o se terminen todas las fuentes
+        stop_event = stop_event or threading.Event()
+        self.start()
+        try:
+            while not stop_event.is_set():
+                self._dispatch(on_results)
+                if self.all_ended:
+                    break
+                stop_event.wait(poll_interval)
+        finally:
+            self.stop()
+        # Resultados que quedaron en cola al terminar
+        self._dispatch(on_results)
+
+    def _dispatch(self, on_results):
+        for name, results in self.poll().items():
+            if results and on_results is not None:
+                on_results(name, results)
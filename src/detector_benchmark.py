@@ -0,0 +1,50 @@
+# detector_benchmark.py
+# Compara los detectores de caras sobre las fotos de la galería: latencia por imagen y recall
+# (fotos en las que encontró la cara). Sirve para elegir --detector / --detector-scale en cada terminal.
+#
+# Ejecutar:
+#   python -m src.detector_benchmark
+#   python -m src.detector_benchmark --backend hog --backend haar --scale 0.5 --scale 1 --limit 50
+
+import argparse
+
+from . import utils_db
+from . import utils_recognition as u_rec
+
+
+def build_detectors(backends, scales, upsample):
+    # Los que no se pueden crear (faltan los modelos) se informan y se saltean
+    detectors = []
+    for backend in backends:
+        for scale in scales:
+            kwargs = {"scale": scale}
+            if backend == "hog":
+                kwargs["upsample"] = upsample
+            try:
+                detectors.append(u_rec.make_detector(backend, **kwargs))
+            except FileNotFoundError as e:
+                print(f"{backend + ' scale=' + format(scale, 'g'):<28} no disponible: {e}")
+    return detectors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de detectores de caras sobre la galería")
+    parser.add_argument("--images", default=utils_db.PYME_EMPLOYEES_IMAGES, help="Carpeta con las fotos de empleados")
+    parser.add_argument("--backend", action="append", dest="backends", choices=u_rec.DETECTOR_BACKENDS,
+                        help="Detector a medir; repetir para varios (default: todos)")
+    parser.add_argument("--scale", action="append", dest="scales", type=float,
+                        help="Escala de entrada; repetir para varias (default: 0.25, 0.5 y 1)")
+    parser.add_argument("--upsample", type=int, default=1, help="Upsample del detector HOG")
+    parser.add_argument("--limit", type=int, default=None, help="Cantidad máxima de fotos")
+    parser.add_argument("--repeat", type=int, default=1, help="Corridas por foto para promediar latencia")
+    args = parser.parse_args(argv)
+
+    detectors = build_detectors(args.backends or u_rec.DETECTOR_BACKENDS, args.scales or [0.25, 0.5, 1.0], args.upsample)
+    print(f"{'detector':<28} {'fotos':>6} {'recall':>7} {'media ms':>9} {'p95 ms':>8}")
+    for detector in detectors:
+        (row,) = u_rec.benchmark_detectors(args.images, [detector], limit=args.limit, repeat=args.repeat)
+        print(f"{row['detector']:<28} {row['images']:>6} {row['recall']:>7.1%} {row['mean_ms']:>9.1f} {row['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,11 @@
 # Requiere: customtkinter, pillow, opencv-python
 
 import os
+import queue
+import threading
+import time
+import unicodedata
 import cv2
-import numpy as np
 
 try:
     import customtkinter as ctk
@@ -31,8 +34,23 @@ from . import utils_recognition as u_rec  # en tu repo actual el módulo se llam
 from . import utils_db
 from . import utils_files
 from src.presence import PresenceManager
+from .recognition_pipeline import FrameRecognizer, MotionGate, RecognitionPipeline, parse_roi
+from .cameras import is_video_file, open_capture
+from .attendance_writer import AttendanceWriter, AttendanceWriterError
 
 DATABASE_PATH = utils_db.PYME_EMPLOYEES_IMAGES
+# Índice de la cámara, archivo de video o URL (rtsp://...). Para varias puertas usar src.cameras.CameraManager
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "0")
+# Región donde se busca movimiento antes de detectar caras: "x0,y0,x1,y1" en fracciones (vacío = todo el frame)
+CAMERA_ROI = os.getenv("CAMERA_ROI", "")
+# Detector de caras para la webcam (hog, haar o dnn; ver python -m src.detector_benchmark)
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "hog")
+# La vista previa es cosmética: se dibuja a lo sumo a estos fps, aunque la cámara entregue más
+PREVIEW_MAX_FPS = float(os.getenv("PREVIEW_MAX_FPS", "15"))
+PREVIEW_DEFAULT_SIZE = (900, 500)
+# Estado de presencia entre sesiones (se guarda cada PRESENCE_SNAPSHOT_INTERVAL segundos y al cerrar)
+PRESENCE_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(utils_db.PYME_DB)), ".presence_gui.npz")
+PRESENCE_SNAPSHOT_INTERVAL = 10.0
 os.makedirs(DATABASE_PATH, exist_ok=True)
 
 # ---------------- Aplicación ----------------
@@ -46,24 +64,26 @@ class ModernFaceApp(ctk.CTkToplevel):
 
         # Estado
         self.webcam_running = False
-        self.cap = None
+        self.pipeline = None
+        self.recognizer = None
+        self.last_shown_frame_id = None
         self.video_loop_job = None
+        # Vista previa: una sola PhotoImage reutilizada; cajas/nombres del último resultado
+        self.preview_photo = None
+        self.preview_rendered_at = 0.0
+        self.last_result = None
+        self.employee_names = {}
         self.threshold_var = ctk.DoubleVar(value=u_rec.EUCLIDEAN_DISTANCE_TOLERANCE)
-
+        # Cómo se decide el match de un empleado con varias fotos (ver u_rec.MATCH_STRATEGIES)
+        self.match_strategy = "min"
+        self.match_min_votes = 2
 
         # Utils de optimización
-        # scanear face encoding uno de cada (self.skip_count_fps) frames de webcam
-        self.skip_fps = 5
-        self.count_current_fps = 0
-
-        # Evitar encoding cuando el frame anterior tenía cara (se asume que es la misma persona)
-        self.last_processed_webcam_frame_had_known_face = False
-
-        # Scanear la misma cara (self.max_retries_face_encoding) veces para intentar ver si se encuentra en la DB
-        # Para evitar problemas conde tiempo de scaneo con (self.last_processed_webcam_frame_had_known_face)
-        # Aún no está implementado TODO
+        # El reconocimiento corre en un hilo aparte (RecognitionPipeline) sobre el último frame disponible,
+        # así que ya no hace falta saltear frames a mano: los que no llega a procesar se descartan.
+        # Mientras la misma cara siga en cuadro no se recalcula el encoding; si no se encuentra en la DB
+        # se reintenta hasta (self.max_attempts_face_encoding) veces.
         self.max_attempts_face_encoding = 3
-        self.count_attempts_face_encoding = 0
 
         # Presence automation
         self.presence = PresenceManager(
@@ -83,19 +103,38 @@ class ModernFaceApp(ctk.CTkToplevel):
         self._build_right_panel()
 
         # Inicializar DB y encodings
-        self.db_encs = None
+        self.db_gallery = None
+        self.legajo_lookup = None
+        self.gallery = u_rec.GalleryIndex()
+        self.gallery_checked_at = 0.0
+        self.encodings_thread = None
+        self.encodings_queue = queue.Queue()
+        self.encodings_callbacks = []  # se llaman en el hilo de Tk cuando termina el job en curso
+        self.attendance_writer = None
+        self.attendance_log_queue = queue.Queue()
         try:
             utils_db.ensure_db_seeded()
+            # archivo -> legajo en memoria; se invalida solo al mapear nuevas fotos
+            self.legajo_lookup = utils_db.LegajoLookup()
+            # Las asistencias se escriben en un hilo aparte, en lotes, sin bloquear la GUI
+            self.attendance_writer = AttendanceWriter(
+                on_written=lambda evento, legajo, t: self.attendance_log_queue.put((evento, legajo, t))
+            )
+            self.attendance_writer.start()
+            # Retoma presencias/cooldowns de la sesión anterior y los turnos abiertos en la DB
+            self.presence.load_snapshot(PRESENCE_SNAPSHOT)
+            self.presence.warm_start(utils_db.load_open_shifts())
+            self.presence_saved_at = time.monotonic()
+            self.after(250, self._poll_attendance_log)
         except Exception as e:
             self._safe_log(f"[DB] No se pudo preparar la DB: {e}")
 
         self._safe_log("Generando/actualizando encodings de la base...")
         try:
-            u_rec._save_encodings_if_necessary(DATABASE_PATH)
-            self.db_encs = u_rec.get_saved_encodings(DATABASE_PATH)
-            self._safe_log("Encodings listos.\n")
+            self._reload_gallery()  # lo que ya estaba en cache queda disponible de inmediato
         except Exception as e:
-            self._safe_log(f"[ADVERTENCIA] No se pudieron generar encodings iniciales: {e}\n")
+            self._safe_log(f"[ADVERTENCIA] No se pudo leer el cache de encodings: {e}")
+        self._start_encodings_job("Encodings listos.\n", "[ADVERTENCIA] No se pudieron generar encodings iniciales")
 
     # ---------- UI BUILDERS ----------
     def _build_sidebar(self):
@@ -123,6 +162,13 @@ class ModernFaceApp(ctk.CTkToplevel):
         self.thr_scale = ctk.CTkSlider(self.sidebar, from_=0, to=1, number_of_steps=100, variable=self.threshold_var)
         self.thr_scale.pack(padx=16, pady=(0,10), fill="x")
 
+        # Estrategia de match por empleado
+        strat_label = ctk.CTkLabel(self.sidebar, text="Estrategia de match")
+        strat_label.pack(padx=16, pady=(6,2))
+        self.strategy_opt = ctk.CTkOptionMenu(self.sidebar, values=list(u_rec.MATCH_STRATEGIES), command=self._on_strategy_change)
+        self.strategy_opt.set(self.match_strategy)
+        self.strategy_opt.pack(padx=16, pady=(0,10), fill="x")
+
         # Tema
         theme_label = ctk.CTkLabel(self.sidebar, text="Tema")
         theme_label.pack(padx=16, pady=(10,2))
@@ -183,40 +229,124 @@ class ModernFaceApp(ctk.CTkToplevel):
     def _on_theme_change(self, mode):
         ctk.set_appearance_mode(mode)
 
-    # ---------- Resolución de legajo ----------
-    def _extract_legajo_from_key(self, key: str):
-        import os
-        base = os.path.splitext(key)[0]
-        return int(base) if str(base).isdigit() else None
-
-    def _resolve_legajo_from_fname(self, fname: str):
-        # 1) Si el nombre del archivo es un número → legajo directo
-        leg = self._extract_legajo_from_key(fname)
-        if leg is not None:
-            return leg
-        # 2) Intentar buscar mapeo en DB
-        try:
-            with utils_db.get_connection() as conn:
-                cur = conn.cursor()
-                mapped = utils_db.get_legajo_for_filename(cur, fname)
-                if mapped is not None:
-                    return mapped
-        except Exception:
-            pass
-        return None
+    def _on_strategy_change(self, strategy):
+        self.match_strategy = strategy
+
+    def _reload_gallery(self, force=False):
+        # La galería sale de rostros_encodings ya cruzada con rostros (legajo incluido);
+        # si la base no cambió desde la última vez, refresh() no hace ninguna consulta
+        if self.db_gallery is None:
+            self.db_gallery = u_rec.DbGallery()
+        else:
+            self.db_gallery.refresh(force=force)
+        self.gallery = self.db_gallery.index
+        self.gallery_checked_at = time.monotonic()
+
+    # ---------- Encodings en segundo plano ----------
+    def _start_encodings_job(self, done_msg, error_msg, on_done=None):
+        # Corre _save_encodings_if_necessary (ProcessPool) en un hilo y reporta el progreso por una cola.
+        # on_done se llama en el hilo de Tk al terminar (también si falló: se sigue con la galería
+        # cargada). Si ya hay un job corriendo no se lanza otro: on_done espera a que termine ése.
+        # Sólo se llama desde el hilo de Tk, así que mirar encodings_thread no compite con nadie.
+        if on_done is not None:
+            self.encodings_callbacks.append(on_done)
+        if self.encodings_thread is not None and self.encodings_thread.is_alive():
+            self._safe_log("Actualización de encodings en curso; se continúa cuando termine.")
+            return
+        q = self.encodings_queue = queue.Queue()
+
+        def work():
+            try:
+                u_rec._save_encodings_if_necessary(DATABASE_PATH, progress=lambda done, total: q.put(("progress", done, total)))
+                u_rec.sync_encodings_to_db(DATABASE_PATH)
+                q.put(("done", None))
+            except Exception as e:
+                q.put(("error", e))
+
+        self.encodings_thread = threading.Thread(target=work, daemon=True, name="EncodingsJob")
+        self.encodings_thread.start()
+        self._encodings_last_pct = -1
+        self.after(100, self._poll_encodings_job, done_msg, error_msg)
+
+    def _poll_encodings_job(self, done_msg, error_msg):
+        while True:
+            try:
+                kind, *payload = self.encodings_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                done, total = payload
+                pct = (100 * done // total) // 10 * 10 if total else 100
+                if pct != self._encodings_last_pct:
+                    self._encodings_last_pct = pct
+                    self._safe_log(f"Encodings: {done}/{total} imágenes nuevas ({pct}%)")
+            elif kind == "done":
+                self._reload_gallery(force=True)
+                if done_msg:
+                    self._safe_log(done_msg)
+                self._run_encodings_callbacks()
+                return
+            else:
+                self._safe_log(f"{error_msg}: {payload[0]}")
+                self._run_encodings_callbacks()
+                return
+        self.after(100, self._poll_encodings_job, done_msg, error_msg)
+
+    def _run_encodings_callbacks(self):
+        callbacks, self.encodings_callbacks = self.encodings_callbacks, []
+        for callback in callbacks:
+            callback()
 
     # ---------- Presence callback ----------
     def _on_presence_event(self, evento: str, legajo: int, t: float):
         if legajo is None:
             self._safe_log("Por algun motivo legajo None llegó a este método")
             return
+        if self.attendance_writer is None:
+            self._safe_log(f"[DB] Sin conexión a la base: no se registró {evento} del legajo {legajo}")
+            return
         try:
-            with utils_db.get_connection() as conn:
-                cur = conn.cursor()
-                utils_db.empleado_detected(cur, legajo, t)
+            self.attendance_writer.submit(legajo, t, evento)
+        except AttendanceWriterError as e:
+            self._safe_log(f"[DB] {e}: no se registró {evento} del legajo {legajo}")
+
+    def _poll_attendance_log(self):
+        # Lo que el AttendanceWriter ya confirmó en la DB
+        if self.attendance_writer is None:
+            return  # ventana cerrada
+        # Salidas de quienes dejaron de verse (con un archivo de video, en el tiempo del video)
+        self.presence.tick(self.pipeline.clock() if self.pipeline is not None else None)
+        if time.monotonic() - self.presence_saved_at >= PRESENCE_SNAPSHOT_INTERVAL:
+            self._save_presence()
+        while True:
+            try:
+                evento, legajo, t = self.attendance_log_queue.get_nowait()
+            except queue.Empty:
+                break
             self._safe_log(f"[DB] Legajo {legajo}: {evento.upper()} registrada a las {utils_db.get_timestamp_from_posix_version(t)}")
-        except Exception as e:
-            traceback.print_exc()
+        self.after(250, self._poll_attendance_log)
+
+    def _save_presence(self):
+        self.presence_saved_at = time.monotonic()
+        try:
+            self.presence.save_snapshot(PRESENCE_SNAPSHOT)
+        except OSError as e:
+            self._safe_log(f"[WARN] No se pudo guardar el estado de presencia: {e}")
+
+    def destroy(self):
+        self.on_stop_webcam()
+        if self.attendance_writer is not None:
+            self._save_presence()
+            self.attendance_writer.stop()  # escribe lo que quedó en cola antes de cerrar
+            self.attendance_writer = None
+        # Conexiones de larga duración de esta ventana
+        if self.legajo_lookup is not None:
+            self.legajo_lookup.close()
+            self.legajo_lookup = None
+        if self.db_gallery is not None:
+            self.db_gallery.close()
+            self.db_gallery = None
+        super().destroy()
 
     # ---------- Actions ----------
     def on_add_users(self):
@@ -283,31 +413,24 @@ class ModernFaceApp(ctk.CTkToplevel):
             return
 
         self._safe_log(f"Imagen seleccionada: {img_path}")
-        try:
-            u_rec._save_encodings_if_necessary(DATABASE_PATH)
-#            self.db_encs = u_rec.get_saved_encodings(DATABASE_PATH)
+        # Primero se incorporan las fotos nuevas (en segundo plano) y después se compara
+        self._start_encodings_job(None, "[ADVERTENCIA] No se pudieron actualizar los encodings",
+                                  on_done=lambda: self._compare_image(img_path))
 
+    def _compare_image(self, img_path):
+        try:
             main_enc = u_rec.get_face_encoding(img_path)
             if main_enc is None:
                 self._safe_log("No se detectó un rostro válido en la imagen.")
                 return
 
-            matches = []
-            for fname, person_enc in self.db_encs.items():
-                if person_enc is None:
-                    continue
-                try:
-                    d, same = u_rec.comparison(main_enc, person_enc, tolerance=self.threshold_var.get())
-                except Exception as e:
-                    self._safe_log(f"[ERROR] Comparando con {fname}: {e}")
-                    continue
-                if same:
-                    matches.append((fname, d))
+            matches = self.gallery.search(main_enc, tolerance=self.threshold_var.get())
 
             if matches:
                 self._safe_log("¡Coincidencias encontradas!")
-            #    for f, dist in sorted(matches, key=lambda x: x[1]):
-#                    self._safe_log(f"  - {f} | distancia = {dist:.4f} (umbral ~ {self.threshold_var.get():.2f})")
+                for f, dist in matches:
+                    leg = self.legajo_lookup(f) if self.legajo_lookup is not None else u_rec.legajo_from_filename(f)
+                    self._safe_log(f"  - {f} (legajo {leg if leg is not None else '?'}) | distancia = {dist:.4f} (umbral ~ {self.threshold_var.get():.2f})")
             else:
                 self._safe_log("No se encontraron coincidencias.")
 
@@ -318,16 +441,15 @@ class ModernFaceApp(ctk.CTkToplevel):
 
     def on_rebuild_encodings(self):
         self._safe_log("Regenerando encodings...")
-        try:
-            u_rec._save_encodings_if_necessary(DATABASE_PATH)
-            self._safe_log("Encodings regenerados correctamente.")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudieron regenerar encodings: {e}")
+        self._start_encodings_job("Encodings regenerados correctamente.", "[ERROR] No se pudieron regenerar encodings")
 
     def on_check_bad_images(self):
+        self._start_encodings_job(None, "[ADVERTENCIA] No se pudieron actualizar los encodings",
+                                  on_done=self._report_bad_images)
+
+    def _report_bad_images(self):
         try:
-            u_rec._save_encodings_if_necessary(DATABASE_PATH)
-            all_encs = self.db_encs
+            all_encs = u_rec.get_saved_encodings(DATABASE_PATH)
             bad = []
             for name, enc in all_encs.items():
                 if enc is None:
@@ -345,10 +467,33 @@ class ModernFaceApp(ctk.CTkToplevel):
     def on_start_webcam(self):
         if self.webcam_running:
             return
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        # Todo lo que puede fallar por configuración (detector, tracker, ROI) va antes de abrir la
+        # cámara, así un error no deja el dispositivo tomado
+        try:
+            recognizer = FrameRecognizer(
+                self.gallery,
+                tolerance=self.threshold_var.get(),
+                strategy=self.match_strategy,
+                min_votes=self.match_min_votes,
+                max_attempts=self.max_attempts_face_encoding,
+                motion_gate=MotionGate(roi=parse_roi(CAMERA_ROI)),
+                detector=u_rec.make_detector(FACE_DETECTOR),
+            )
+        except (FileNotFoundError, ValueError) as e:
+            messagebox.showerror("Webcam", f"No se pudo preparar el reconocimiento: {e}")
+            return
+        try:
+            cap = open_capture(CAMERA_SOURCE)
+        except RuntimeError:
             messagebox.showerror("Webcam", "No se pudo abrir la cámara.")
             return
+        self.recognizer = recognizer
+        self.pipeline = RecognitionPipeline(cap, self.recognizer, video_file=is_video_file(CAMERA_SOURCE))
+        self.pipeline.start()
+        self.last_shown_frame_id = None
+        self.last_result = None
+        self.preview_rendered_at = 0.0
+        self._load_employee_names()
         self.webcam_running = True
         self._update_video_frame()
 
@@ -357,87 +502,100 @@ class ModernFaceApp(ctk.CTkToplevel):
         if self.video_loop_job:
             self.after_cancel(self.video_loop_job)
             self.video_loop_job = None
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
 
         # Poner imagen vacía para que no muestre el último frame de la webcam
-        blank = Image.new("RGB", (900, 500), (0,0,0))
+        blank = Image.new("RGB", PREVIEW_DEFAULT_SIZE, (0,0,0))
         imgtk = ImageTk.PhotoImage(blank)
         self.video_label.configure(text="Webcam detenida", image=imgtk)
         self.video_label.imgtk_ref = imgtk
+        self.preview_photo = None
+
+    def _sync_recognizer_settings(self):
+        # Los widgets de Tk sólo se leen desde el hilo principal; el worker ve atributos planos
+        if time.monotonic() - self.gallery_checked_at >= 1.0:
+            self._reload_gallery()  # levanta altas/mapeos nuevos sin reiniciar la webcam
+        self.recognizer.gallery = self.gallery
+        self.recognizer.tolerance = self.threshold_var.get()
+        self.recognizer.strategy = self.match_strategy
+        self.recognizer.min_votes = self.match_min_votes
+
+    def _handle_recognition_result(self, result):
+        if result.present:
+            self.presence.detections(result.present, result.timestamp)
+        if not result.encoded:
+            return
+        for leg, d in result.matches:
+            self._safe_log(f"Match con legajo {leg} | d={d:.4f} (umbral ~ {self.recognizer.tolerance:.2f}, {self.recognizer.strategy})")
+        if not result.matches:
+            self._safe_log("Sin coincidencias en este frame.")
 
     def _update_video_frame(self):
-
-        if not self.webcam_running or self.cap is None:
+        # Corre en el loop de Tk: sólo muestra el último frame y consume resultados ya calculados
+        if not self.webcam_running or self.pipeline is None:
             return
 
-        ret, frame = self.cap.read()
-        if not ret:
+        if self.pipeline.ended:
             self.on_stop_webcam()
             return
 
-
-        if  self.count_current_fps < self.skip_fps:
-            print("[SKIP] Frame")
-            self.count_current_fps += 1
-
+        self._sync_recognizer_settings()
+        for result in self.pipeline.drain_results():
+            self._handle_recognition_result(result)
+            self.last_result = result
+
+        now = time.monotonic()
+        latest = self.pipeline.latest_frame()
+        if (latest is not None and latest[0] != self.last_shown_frame_id
+                and now - self.preview_rendered_at >= 1.0 / PREVIEW_MAX_FPS):
+            self.last_shown_frame_id, _, frame = latest
+            self.preview_rendered_at = now
+            self._render_preview(frame)
+        # Refresco al ritmo de la cámara (medido), sin pasar de PREVIEW_MAX_FPS
+        fps = min(self.pipeline.grabber.fps or PREVIEW_MAX_FPS, PREVIEW_MAX_FPS)
+        self.video_loop_job = self.after(min(100, max(15, int(1000 / fps))), self._update_video_frame)
+
+    def _load_employee_names(self):
+        try:
+            with utils_db.get_connection() as conn:
+                self.employee_names = utils_db.get_nombres_empleados(conn.cursor())
+        except Exception as e:
+            self.employee_names = {}
+            self._safe_log(f"[WARN] No se pudieron leer los nombres de empleados: {e}")
+
+    def _preview_label(self, legajos):
+        if not legajos:
+            return "?"
+        text = ", ".join(self.employee_names.get(leg, f"Legajo {leg}") for leg in legajos)
+        # Las fuentes de cv2.putText son ASCII: se sacan los acentos
+        return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+    def _render_preview(self, frame):
+        # Un solo cv2.resize (INTER_AREA) al tamaño real del widget, cajas y nombres del último
+        # resultado, y se pega sobre la misma PhotoImage mientras el tamaño no cambie
+        w, h = self.video_label.winfo_width(), self.video_label.winfo_height()
+        if w <= 1 or h <= 1:
+            w, h = PREVIEW_DEFAULT_SIZE
+        display = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        result = self.last_result
+        if result is not None and result.boxes:
+            sx, sy = w / frame.shape[1], h / frame.shape[0]
+            for box, legajos in zip(result.boxes, result.box_legajos or [[]] * len(result.boxes)):
+                top, right, bottom, left = box
+                p0, p1 = (int(left * sx), int(top * sy)), (int(right * sx), int(bottom * sy))
+                color = (0, 200, 0) if legajos else (0, 165, 255)
+                cv2.rectangle(display, p0, p1, color, 2)
+                cv2.putText(display, self._preview_label(legajos), (p0[0], max(12, p0[1] - 6)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+        img = Image.fromarray(cv2.cvtColor(display, cv2.COLOR_BGR2RGB))
+        if self.preview_photo is None or (self.preview_photo.width(), self.preview_photo.height()) != (w, h):
+            self.preview_photo = ImageTk.PhotoImage(image=img)
+            self.video_label.configure(image=self.preview_photo, text="")
+            self.video_label.imgtk_ref = self.preview_photo  # evitar GC
         else:
-
-            self.count_current_fps = 0
-
-            process_small = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            # Si tu encoder requiere RGB, descomentar:
-            # process_small = cv2.cvtColor(process_small, cv2.COLOR_BGR2RGB)
-
-            try:
-                face_loc = u_rec.get_face_location(process_small)
-                if face_loc is not None:
-                    if self.last_processed_webcam_frame_had_known_face:
-                        enc = None
-                        print("[SKIP] Misma persona detectada.")
-                    else:
-                        enc = u_rec.get_face_encoding(process_small,known_location=face_loc)
-                        print("Nueva cara detectada")
-                else:
-                    self.last_processed_webcam_frame_had_known_face = False
-                    self.count_attempts_face_encoding = 0
-                    enc = None
-
-
-            except u_rec.MultipleFacesDetectedException as e:
-                self._safe_log("[ERROR] Se detectaron más de una cara en la webcam. Por favor, limite a una sola persona por reconocimiento.")
-                self.last_processed_webcam_frame_had_known_face = False
-                enc = None
-
-            if enc is not None and self.db_encs is not None:
-                self.last_processed_webcam_frame_had_known_face = True
-                print("Buscando coincidencias...")
-                any_match = False
-                for fname, other_enc in self.db_encs.items():
-                    if other_enc is None:
-                        continue
-                    try:
-                        d, same = u_rec.comparison(enc, other_enc, tolerance=self.threshold_var.get())
-                    except Exception as e:
-                        self._safe_log(f"[ERROR] Comparando con {fname}: {e}")
-                        continue
-                    if same:
-                        any_match = True
-                        self._safe_log(f"Match con {fname} | d={d:.4f} (umbral ~ {self.threshold_var.get():.2f})")
-                        leg = self._resolve_legajo_from_fname(fname)
-                        self.presence.detection(leg)
-                if not any_match:
-                    self._safe_log("Sin coincidencias en este frame.")
-
-        # Mostrar en la UI (convertir a RGB para Pillow)
-        display = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(display)
-        img = img.resize((900, 500), Image.LANCZOS)
-        imgtk = ImageTk.PhotoImage(image=img)
-        self.video_label.configure(image=imgtk, text="")
-        self.video_label.imgtk_ref = imgtk  # evitar GC
-        self.video_loop_job = self.after(30, self._update_video_frame)
+            self.preview_photo.paste(img)
 
 
 if __name__ == "__main__":
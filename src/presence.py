@@ -1,14 +1,36 @@
 # presence.py
+# Entradas/salidas a partir de detecciones. Los tracks se guardan como struct-of-arrays de NumPy
+# indexados por un slot por legajo (legajo -> slot en un dict): todo el personal de todas las
+# puertas entra en unos pocos arrays contiguos, se barre vectorizado y se copia barato (snapshot()).
+# Mientras un legajo está presente vence en max(última vez visto + disappear_seconds,
+# entrada + cooldown_seconds); tick(now) busca los vencidos en un solo barrido y emite la "salida"
+# aunque la persona no vuelva a pasar por la cámara. El vencimiento decide cuándo se emite; la hora
+# registrada es la última vez que se la vio.
+# save_snapshot/load_snapshot guardan y levantan la tabla (.npz atómico) para reiniciar sin perder
+# presencias ni cooldowns; warm_start marca presentes a los que tienen un turno abierto en la DB.
+# Un track marcado así no tiene avistamiento real: si se lo ve se sigue como cualquier otro (sin
+# repetir la entrada); si vence sin que se lo vea se descarta en silencio, sin inventar una salida.
+import logging
+import os
+import zipfile
 from dataclasses import dataclass
-from typing import Dict, Callable, Optional
+from typing import Dict, Callable, Iterable, Optional
 from time import time
 
-@dataclass
+import numpy as np
+
+from .utils_files import atomic_write
+
+log = logging.getLogger("presence")
+
+@dataclass(slots=True)
 class Track:
+    # Vista (copia) del estado de un legajo, ver PresenceManager.get_state
     last_seen: float = 0.0
     seen_count: int = 0
     is_present: bool = False
-    last_toggle: float = 0.0
+    warm: bool = False  # presente por un turno abierto en la DB, todavía sin verse
+    last_toggle: float = float("-inf")  # sin cooldown pendiente para un track nuevo
 
 class PresenceManager:
     def __init__(
@@ -17,36 +39,188 @@ class PresenceManager:
         disappear_seconds: float = 10.0,
         cooldown_seconds: float = 30.0,
         now_provider: Callable[[], float] = time,
+        max_expirations_per_tick: int = 1000,
+        capacity: int = 64,
     ) -> None:
         self.on_event = on_event
         self.disappear_seconds = disappear_seconds
         self.cooldown_seconds = cooldown_seconds
         self.now = now_provider
-        self._tracks: Dict[int, Track] = {}
+        self.max_expirations_per_tick = max_expirations_per_tick
+        self._slots: Dict[int, int] = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self._size = 0
+        self._legajo = np.zeros(capacity, dtype=np.int64)
+        self._last_seen = np.zeros(capacity, dtype=np.float64)
+        self._last_toggle = np.full(capacity, -np.inf, dtype=np.float64)
+        self._seen_count = np.zeros(capacity, dtype=np.int64)
+        self._present = np.zeros(capacity, dtype=bool)
+        self._warm = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        capacity = max(1, 2 * len(self._legajo))
+        for name, fill in (("_legajo", 0), ("_last_seen", 0.0), ("_last_toggle", -np.inf),
+                           ("_seen_count", 0), ("_present", False), ("_warm", False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _slot(self, legajo: int) -> int:
+        slot = self._slots.get(legajo)
+        if slot is None:
+            if self._size == len(self._legajo):
+                self._grow()
+            slot = self._size
+            self._size += 1
+            self._slots[legajo] = slot
+            self._legajo[slot] = legajo
+        return slot
+
+    def _deadlines(self, slots) -> np.ndarray:
+        return np.maximum(self._last_seen[slots] + self.disappear_seconds,
+                          self._last_toggle[slots] + self.cooldown_seconds)
 
     def detection(self, legajo: int, t: Optional[float] = None) -> None:
+        self.detections((legajo,), t)
+
+    def detections(self, legajos: Iterable[int], t: Optional[float] = None) -> None:
+        # Todos los legajos reconocidos en un mismo frame
+        if t is None:
+            t = self.now()
+        slots = np.fromiter((self._slot(legajo) for legajo in dict.fromkeys(legajos)), dtype=np.int64)
+        if not len(slots):
+            return
+        present = self._present[slots]
+        deadlines = self._deadlines(slots)
+        # Vencidos sin que corriera tick(): la salida va primero
+        expired = present & (t >= deadlines)
+        for slot in slots[expired]:
+            self._expire(slot)
+        still = slots[present & ~expired]
+        self._last_seen[still] = np.where(self._warm[still], t, np.maximum(self._last_seen[still], t))
+        self._seen_count[still] += 1
+        self._warm[still] = False
+        candidates = slots[~present | expired]
+        entering = candidates[t - self._last_toggle[candidates] >= self.cooldown_seconds]
+        self._last_seen[entering] = t
+        self._seen_count[entering] += 1
+        self._present[entering] = True
+        self._last_toggle[entering] = t
+        for slot in entering:
+            self.on_event("entrada", int(self._legajo[slot]), t)
+
+    def _expire(self, slot) -> bool:
+        # La salida se registra cuando se la vio por última vez, no cuando venció el plazo. Un track
+        # de warm_start que nunca se vio no tiene esa hora: se descarta sin evento (el turno sigue
+        # abierto en la DB y lo cierra la salida del próximo avistamiento real)
+        self._present[slot] = False
+        if self._warm[slot]:
+            self._warm[slot] = False
+            return False
+        t = float(self._last_seen[slot])
+        self._last_toggle[slot] = t
+        self.on_event("salida", int(self._legajo[slot]), t)
+        return True
+
+    def tick(self, now: Optional[float] = None) -> int:
+        # Un barrido vectorizado sobre todos los tracks; emite como mucho max_expirations_per_tick
+        # vencimientos (los más viejos primero, el resto queda para el próximo tick). Devuelve cuántas
+        # salidas emitió.
+        if now is None:
+            now = self.now()
+        n = self._size
+        deadlines = np.maximum(self._last_seen[:n] + self.disappear_seconds,
+                               self._last_toggle[:n] + self.cooldown_seconds)
+        due = np.flatnonzero(self._present[:n] & (deadlines <= now))
+        if len(due) > self.max_expirations_per_tick:
+            due = due[np.argpartition(deadlines[due], self.max_expirations_per_tick - 1)[:self.max_expirations_per_tick]]
+        due = due[np.argsort(deadlines[due], kind="stable")]
+        return sum(self._expire(slot) for slot in due)
+
+    def present(self):
+        return self._legajo[:self._size][self._present[:self._size]].tolist()
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        # Copia de la tabla de tracks (sólo los slots usados)
+        n = self._size
+        return {
+            "legajo": self._legajo[:n].copy(),
+            "last_seen": self._last_seen[:n].copy(),
+            "last_toggle": self._last_toggle[:n].copy(),
+            "seen_count": self._seen_count[:n].copy(),
+            "present": self._present[:n].copy(),
+            "warm": self._warm[:n].copy(),
+        }
+
+    def restore(self, snapshot: Dict[str, np.ndarray]) -> None:
+        # Inverso de snapshot(): reemplaza toda la tabla
+        legajos = np.asarray(snapshot["legajo"], dtype=np.int64)
+        n = len(legajos)
+        self._allocate(max(n, len(self._legajo)))
+        self._size = n
+        self._legajo[:n] = legajos
+        self._last_seen[:n] = snapshot["last_seen"]
+        self._last_toggle[:n] = snapshot["last_toggle"]
+        self._seen_count[:n] = snapshot["seen_count"]
+        self._present[:n] = snapshot["present"]
+        if "warm" in snapshot:
+            self._warm[:n] = snapshot["warm"]
+        self._slots = {int(legajo): slot for slot, legajo in enumerate(legajos)}
+
+    def save_snapshot(self, path: str) -> None:
+        snap = self.snapshot()
+        atomic_write(path, lambda f: np.savez(f, saved_at=np.float64(self.now()), **snap))
+
+    def load_snapshot(self, path: str) -> bool:
+        # Levanta la tabla guardada; si no existe o está corrupta sigue vacía (las ausencias que
+        # vencieron mientras estuvo apagado salen en el próximo tick, con la última hora en que se vio)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                snap = {k: data[k] for k in ("legajo", "last_seen", "last_toggle", "seen_count", "present")}
+                if "warm" in data:  # snapshots anteriores no lo tienen
+                    snap["warm"] = data["warm"]
+                self.restore(snap)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            log.warning("No se pudo leer el snapshot de presencia %s: %s", path, e)
+            return False
+        return True
+
+    def warm_start(self, open_shifts: Dict[int, float], t: Optional[float] = None) -> int:
+        # open_shifts: {legajo: entrada (posix)} de los turnos abiertos en la DB. Los que no figuran
+        # presentes quedan presentes (warm) desde t, sin emitir eventos: si se los ve en los próximos
+        # disappear_seconds no se repite la entrada; si no, se descartan sin emitir la salida, porque
+        # nadie los vio a la hora t. Devuelve cuántos se marcaron.
         if t is None:
             t = self.now()
-        tr = self._tracks.get(legajo)
-        if tr is None:
-            tr = Track()
-            self._tracks[legajo] = tr
-        if not tr.is_present:
-            if t - tr.last_toggle >= self.cooldown_seconds:
-                tr.last_seen = t
-                tr.seen_count+=1
-                tr.is_present = True
-                tr.last_toggle = t
-                self.on_event("entrada", legajo, t)
-        else:
-            if t - tr.last_seen >= self.disappear_seconds and t - tr.last_toggle >= self.cooldown_seconds:
-                tr.is_present = False
-                tr.last_toggle = t
-                self.on_event("salida", legajo, t)
-        print(tr)
+        marked = 0
+        for legajo, entrada in open_shifts.items():
+            slot = self._slot(legajo)
+            if self._present[slot]:
+                continue
+            self._present[slot] = True
+            self._warm[slot] = True
+            self._last_seen[slot] = t
+            self._last_toggle[slot] = entrada
+            marked += 1
+        return marked
 
     def clear(self):
-        self._tracks.clear()
+        self._slots.clear()
+        self._allocate(len(self._legajo))
 
     def get_state(self, legajo: int) -> Optional[Track]:
-        return self._tracks.get(legajo)
\ No newline at end of file
+        slot = self._slots.get(legajo)
+        if slot is None:
+            return None
+        return Track(
+            last_seen=float(self._last_seen[slot]),
+            seen_count=int(self._seen_count[slot]),
+            is_present=bool(self._present[slot]),
+            warm=bool(self._warm[slot]),
+            last_toggle=float(self._last_toggle[slot]),
+        )
@@ -0,0 +1,541 @@
+# recognition_pipeline.py
+# Reconocimiento en segundo plano para no bloquear el loop de Tk con dlib:
+#   captura (hilo) -> LatestFrameSlot (1 lugar, el frame nuevo pisa al viejo) -> worker (hilo) -> cola de resultados
+# La vista previa lee siempre el último frame capturado (va a la velocidad de la cámara) y el
+# reconocimiento procesa lo que la CPU aguante; los frames viejos se descartan, nunca se encolan.
+# Entre keyframes las caras se siguen con un tracker de OpenCV en vez de volver a detectarlas.
+# No depende de Tk: lo usan tanto la GUI como el modo sin interfaz.
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import cv2
+
+from . import utils_recognition as u_rec
+
+log = logging.getLogger("recognition_pipeline")
+
+# Escala a la que se corre detección/encoding (igual que el loop original de la webcam)
+PROCESS_SCALE = 0.25
+
+
+class LatestFrameSlot:
+    # Cola acotada de un solo lugar: put() reemplaza el frame pendiente (latest-frame-wins)
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item, wait=False):
+        # wait=True: esperar a que el consumidor tome el pendiente en vez de pisarlo (sin descartes)
+        with self._cond:
+            while wait and self._item is not None and not self._closed:
+                self._cond.wait()
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        # Devuelve el frame pendiente (y libera el lugar) o None si se cerró / venció el timeout
+        with self._cond:
+            if self._item is None and not self._closed:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            self._cond.notify_all()  # put(wait=True) esperando lugar
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+@dataclass
+class RecognitionResult:
+    frame_id: int
+    timestamp: float
+    matches: List[Tuple[int, float]] = field(default_factory=list)  # [(legajo, distancia)]
+    present: List[int] = field(default_factory=list)  # legajos en cuadro (reconocidos ahora o antes, mismo track)
+    boxes: list = field(default_factory=list)  # (top, right, bottom, left) en coordenadas del frame original
+    box_legajos: List[List[int]] = field(default_factory=list)  # legajos reconocidos en cada caja (paralelo a boxes)
+    face_found: bool = False
+    encoded: bool = False  # se calculó encoding y se buscó en la galería
+    multiple_faces: bool = False  # más de una cara en cuadro (se reconocen todas)
+    motion: bool = True  # hubo cambios en la región de interés (o no hay MotionGate)
+    latency: float = 0.0
+
+
+# Trackers de OpenCV (contrib) para seguir las caras entre keyframes; None = detectar en cada frame
+TRACKER_KINDS = ("kcf", "csrt", "mosse")
+# Segundos entre detecciones completas (HOG) mientras haya caras seguidas por el tracker
+KEYFRAME_INTERVAL = 1.0
+# Solapamiento mínimo para considerar que una detección es la misma cara que un track
+TRACK_IOU_THRESHOLD = 0.3
+
+
+def make_tracker(kind):
+    # cv2.legacy existe con opencv-contrib-python; sin contrib se cae al API nuevo (sin MOSSE)
+    name = f"Tracker{kind.upper()}_create"
+    factory = getattr(getattr(cv2, "legacy", None), name, None) or getattr(cv2, name, None)
+    if factory is None:
+        raise ValueError(f"Tracker no disponible en esta instalación de OpenCV: {kind} (opciones: {', '.join(TRACKER_KINDS)})")
+    return factory()
+
+
+def _clamp_box(box, shape):
+    top, right, bottom, left = box
+    h, w = shape[:2]
+    return max(0, top), min(w, right), min(h, bottom), max(0, left)
+
+
+def _box_to_xywh(box):
+    top, right, bottom, left = box
+    return left, top, right - left, bottom - top
+
+
+def _xywh_to_box(xywh):
+    x, y, w, h = (int(round(v)) for v in xywh)
+    return y, x + w, y + h, x
+
+
+def _iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area = lambda r: max(0, r[1] - r[3]) * max(0, r[2] - r[0])
+    union = area(a) + area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+MOTION_METHODS = ("mog2", "diff")
+
+
+def parse_roi(text):
+    # "x0,y0,x1,y1" en fracciones del frame (0..1) -> tupla; vacío / None -> frame completo
+    if not text:
+        return None
+    roi = tuple(float(v) for v in text.split(","))
+    if len(roi) != 4 or not (0 <= roi[0] < roi[2] <= 1 and 0 <= roi[1] < roi[3] <= 1):
+        raise ValueError(f"ROI inválida: {text} (se espera x0,y0,x1,y1 con valores entre 0 y 1)")
+    return roi
+
+
+class MotionGate:
+    # Filtro barato antes de la detección HOG: sobre una copia gris diminuta (width px de ancho) de la
+    # región de interés, MOG2 o diferencia con el frame anterior. changed() es True si la fracción de
+    # píxeles que cambiaron supera min_area. Con el pasillo vacío no se corre la detección.
+    def __init__(self, method="mog2", roi=None, width=160, threshold=25, min_area=0.01):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Método de movimiento desconocido: {method} (opciones: {', '.join(MOTION_METHODS)})")
+        self.method = method
+        self.roi = roi  # (x0, y0, x1, y1) en fracciones del frame
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.level = 0.0  # fracción de píxeles que cambiaron en el último frame
+        self._prev = None
+        self._subtractor = (
+            cv2.createBackgroundSubtractorMOG2(history=300, varThreshold=threshold, detectShadows=False)
+            if method == "mog2" else None
+        )
+
+    def _tiny(self, frame):
+        if self.roi is not None:
+            h, w = frame.shape[:2]
+            x0, y0, x1, y1 = self.roi
+            frame = frame[int(y0 * h):max(int(y1 * h), int(y0 * h) + 1), int(x0 * w):max(int(x1 * w), int(x0 * w) + 1)]
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(h * self.width / w)))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed(self, frame):
+        tiny = self._tiny(frame)
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(tiny)
+        else:
+            prev, self._prev = self._prev, tiny
+            if prev is None or prev.shape != tiny.shape:
+                self.level = 1.0
+                return True
+            mask = cv2.absdiff(tiny, prev) > self.threshold
+        self.level = float(cv2.countNonZero(mask.astype("uint8"))) / mask.size
+        return self.level >= self.min_area
+
+
+# Funciones de módulo (picklables) para poder correrlas en un ThreadPool o ProcessPool.
+# Reciben el frame ya reducido; las cajas son (top, right, bottom, left) en ese frame.
+def detect_faces(small, detector=None):
+    # Todas las caras del frame (en el cambio de turno entran varias personas juntas)
+    # Si tu encoder requiere RGB, descomentar:
+    # small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    return u_rec.get_face_locations(small, detector)
+
+
+def encode_faces(small, boxes):
+    # Un solo face_encodings para todas las cajas
+    return u_rec.get_face_encodings(small, known_locations=list(boxes))
+
+
+@dataclass
+class FaceTrack:
+    box: Tuple[int, int, int, int]  # en el frame reducido
+    tracker: object = None
+    matches: List[Tuple[int, float]] = field(default_factory=list)  # como mucho uno: la mejor coincidencia
+    attempts: int = 0  # encodings calculados para esta cara
+    settled: bool = False  # reconocida, o se agotaron los intentos: no se vuelve a codificar
+
+    @property
+    def legajos(self):
+        return [leg for leg, _ in self.matches]
+
+
+class FrameRecognizer:
+    # Detect-then-track: la detección HOG corre en keyframes (cada keyframe_interval segundos, o
+    # cuando no hay caras seguidas / se perdió alguna) y entre keyframes las cajas se siguen con un
+    # tracker de OpenCV sobre el frame reducido. El encoding sólo se calcula para tracks nuevos o sin
+    # reconocer, hasta max_attempts veces por track; una cara reconocida no se vuelve a codificar
+    # mientras el tracker no la pierda. Así el costo escala con las personas que llegan, no con los fps.
+    def __init__(self, gallery, tolerance=u_rec.EUCLIDEAN_DISTANCE_TOLERANCE, strategy="min",
+                 min_votes=1, max_attempts=3, scale=PROCESS_SCALE, executor=None,
+                 tracker="kcf", keyframe_interval=KEYFRAME_INTERVAL, motion_gate: Optional[MotionGate] = None,
+                 idle_detect_interval=5.0, detector: Optional[u_rec.FaceDetector] = None):
+        self.gallery = gallery
+        self.tolerance = tolerance
+        self.strategy = strategy
+        self.min_votes = min_votes
+        self.max_attempts = max_attempts
+        self.scale = scale
+        self.executor = executor  # None = correr en el hilo que llama
+        self.detector = detector  # None = HOG por defecto (ver u_rec.make_detector)
+        self.tracker = tracker
+        self.keyframe_interval = keyframe_interval
+        if tracker is not None:
+            make_tracker(tracker)  # falla acá y no en el primer frame
+        # Sin caras seguidas, sólo se detecta si motion_gate vio movimiento (o cada idle_detect_interval
+        # segundos igual, por si alguien quedó quieto frente a la cámara sin ser detectado)
+        self.motion_gate = motion_gate
+        self.idle_detect_interval = idle_detect_interval
+        self.tracks: List[FaceTrack] = []
+        self.keyframes = 0
+        self.gated = 0  # frames salteados por falta de movimiento
+        self._last_keyframe = float("-inf")
+
+    def reset(self):
+        self.tracks = []
+        self._last_keyframe = float("-inf")
+
+    def _run(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        return self.executor.submit(fn, *args).result()
+
+    def _start_tracker(self, track, small):
+        if self.tracker is None:
+            return
+        track.tracker = make_tracker(self.tracker)
+        if not track.tracker.init(small, _box_to_xywh(track.box)):
+            track.tracker = None
+
+    def _associate(self, small, boxes):
+        # Cada detección se queda con el track que más se le superpone; los tracks sin detección se pierden
+        tracks = []
+        free = list(self.tracks)
+        for box in boxes:
+            best = max(free, key=lambda tr: _iou(tr.box, box), default=None)
+            if best is not None and _iou(best.box, box) >= TRACK_IOU_THRESHOLD:
+                free.remove(best)
+                best.box = box
+            else:
+                best = FaceTrack(box=box)
+            self._start_tracker(best, small)
+            tracks.append(best)
+        self.tracks = tracks
+
+    def _follow(self, small):
+        # Entre keyframes: mover las cajas con el tracker; si alguno se pierde, el próximo frame es keyframe
+        alive = []
+        for track in self.tracks:
+            ok, xywh = track.tracker.update(small) if track.tracker is not None else (False, None)
+            if not ok:
+                # Se mantiene con la última caja para que la próxima detección lo reconozca por solapamiento
+                self._last_keyframe = float("-inf")
+                alive.append(track)
+                continue
+            track.box = _clamp_box(_xywh_to_box(xywh), small.shape)
+            if track.box[1] > track.box[3] and track.box[2] > track.box[0]:
+                alive.append(track)
+        self.tracks = alive
+
+    def _resolve_conflicts(self):
+        # Dos caras no pueden ser el mismo legajo: se lo queda la más cercana y la otra vuelve a
+        # quedar sin reconocer (se recodifica si le quedan intentos)
+        claimed = set()
+        for track in sorted((tr for tr in self.tracks if tr.matches), key=lambda tr: tr.matches[0][1]):
+            legajo = track.matches[0][0]
+            if legajo in claimed:
+                track.matches = []
+                track.settled = track.attempts >= self.max_attempts
+            else:
+                claimed.add(legajo)
+
+    def process(self, frame, frame_id=0, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        start = time.perf_counter()
+        result = RecognitionResult(frame_id=frame_id, timestamp=timestamp)
+        if self.motion_gate is not None:
+            result.motion = self.motion_gate.changed(frame)
+            if (not result.motion and not self.tracks
+                    and timestamp - self._last_keyframe < self.idle_detect_interval):
+                self.gated += 1
+                result.latency = time.perf_counter() - start
+                return result
+        small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale)
+
+        keyframe = self.tracker is None or not self.tracks or timestamp - self._last_keyframe >= self.keyframe_interval
+        if keyframe:
+            boxes = self._run(detect_faces, small, self.detector)
+            self.keyframes += 1
+            self._last_keyframe = timestamp
+            self._associate(small, boxes)
+        else:
+            self._follow(small)
+
+        pending = [tr for tr in self.tracks if not tr.settled]
+        if pending and len(self.gallery) > 0:
+            encodings = self._run(encode_faces, small, [tr.box for tr in pending])
+            if len(encodings) == len(pending):
+                # Todas las caras contra toda la galería en una sola operación
+                per_face = self.gallery.match_employees_batch(
+                    encodings, tolerance=self.tolerance, strategy=self.strategy, min_votes=self.min_votes
+                )
+                result.encoded = True
+                for track, matches in zip(pending, per_face):
+                    track.attempts += 1
+                    # Una cara es una sola persona: la de menor distancia (vienen ordenadas)
+                    track.matches = matches[:1]
+                    track.settled = bool(matches) or track.attempts >= self.max_attempts
+                self._resolve_conflicts()
+                result.matches = [tr.matches[0] for tr in pending if tr.matches]
+
+        result.boxes = [tuple(int(round(c / self.scale)) for c in tr.box) for tr in self.tracks]
+        result.box_legajos = [tr.legajos for tr in self.tracks]
+        result.face_found = bool(self.tracks)
+        result.multiple_faces = len(self.tracks) > 1
+        # Los ya reconocidos siguen presentes mientras el tracker los siga, aunque no se recodifiquen
+        result.present = [leg for tr in self.tracks for leg in tr.legajos]
+        result.latency = time.perf_counter() - start
+        return result
+
+
+class AdaptiveScheduler:
+    # Decide cuánto esperar entre frames procesados según la latencia medida (promedio exponencial):
+    # intervalo = latencia / presupuesto, o sea que el reconocimiento usa como mucho esa fracción de un
+    # núcleo. Con actividad en la escena (caras, movimiento) rige cpu_budget; con la escena quieta,
+    # idle_budget. max_interval acota la espera para no tardar en notar a alguien que llega.
+    def __init__(self, cpu_budget=0.5, idle_budget=0.1, max_interval=1.0, alpha=0.2):
+        if not 0 < idle_budget <= cpu_budget <= 1:
+            raise ValueError("Se espera 0 < idle_budget <= cpu_budget <= 1")
+        self.cpu_budget = cpu_budget
+        self.idle_budget = idle_budget
+        self.max_interval = max_interval
+        self.alpha = alpha
+        self.latency = None  # segundos, promedio exponencial
+        self.active = True
+        self.interval = 0.0
+
+    def record(self, latency, active):
+        self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+        self.active = active
+        budget = self.cpu_budget if active else self.idle_budget
+        self.interval = min(self.latency / budget, max(self.max_interval, self.latency))
+
+    def next_delay(self, latency):
+        # Espera antes de tomar el próximo frame, descontando lo que ya tardó éste
+        return max(0.0, self.interval - latency)
+
+
+class FrameGrabber(threading.Thread):
+    # Lee la cámara lo más rápido que entrega y publica el último frame.
+    # video_file: la fuente es un archivo. Los frames llevan el tiempo del video (arranque +
+    # CAP_PROP_POS_MSEC) y se leen a la velocidad del video, como llegarían de una cámara; con
+    # every_frame se leen sin pausa pero sin descartar ninguno (el worker procesa todos).
+    def __init__(self, cap, slot: LatestFrameSlot, video_file=False, every_frame=False):
+        super().__init__(daemon=True, name="FrameGrabber")
+        self.cap = cap
+        self.slot = slot
+        self.video_file = video_file
+        self.every_frame = every_frame
+        self.frames = 0
+        self.fps = 0.0  # promedio exponencial de la velocidad de captura
+        self.ended = False  # la fuente dejó de entregar frames (cámara desconectada / fin de video)
+        self.clock = None  # timestamp del último frame leído
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._exited = False
+        self._release_on_exit = False
+
+    def _video_time(self, start):
+        pos = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if pos <= 0 and self.frames > 1:
+            # El backend no informa la posición: se deduce de los fps del archivo
+            pos = (self.frames - 1) / (self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        return start + pos
+
+    def run(self):
+        last = None
+        start = None
+        while not self._stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.ended = True
+                break
+            self.frames += 1
+            t = time.time()
+            if self.video_file:
+                if start is None:
+                    start = t
+                t = self._video_time(start)
+                if not self.every_frame and self._stop_event.wait(max(0.0, t - time.time())):
+                    break
+            now = time.time()
+            if last is not None and now > last:
+                self.fps += 0.1 * (1.0 / (now - last) - self.fps)
+            last = now
+            item = (self.frames, t, frame)
+            with self._lock:
+                self._latest = item
+                self.clock = t
+            self.slot.put(item, wait=self.every_frame)
+        self.slot.close()
+        with self._lock:
+            self._exited = True
+            release = self._release_on_exit
+        if release:
+            self.cap.release()
+
+    def release_when_done(self):
+        # Libera la captura si el hilo ya terminó (o nunca arrancó) y devuelve True; si sigue bloqueado
+        # en cap.read() (p.ej. RTSP sin datos) la libera él mismo al salir, para no cerrarla bajo sus pies
+        with self._lock:
+            if self._exited or self.ident is None:
+                self.cap.release()
+                return True
+            self._release_on_exit = True
+            return False
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class RecognitionWorker(threading.Thread):
+    # Consume el último frame disponible y publica RecognitionResult en una cola thread-safe.
+    # Entre frames espera lo que indique el scheduler (None = procesar a la velocidad que dé la CPU).
+    def __init__(self, slot: LatestFrameSlot, recognizer: FrameRecognizer, results: "queue.Queue",
+                 scheduler: Optional[AdaptiveScheduler] = None, error_backoff=0.5):
+        super().__init__(daemon=True, name="RecognitionWorker")
+        self.slot = slot
+        self.recognizer = recognizer
+        self.results = results
+        self.scheduler = scheduler
+        self.processed = 0
+        self.errors = 0
+        self.error_backoff = error_backoff  # espera mínima después de un error, para no girar en vacío
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            item = self.slot.get(timeout=0.2)
+            if item is None:
+                if self.slot.closed:
+                    break
+                continue
+            frame_id, t, frame = item
+            try:
+                result = self.recognizer.process(frame, frame_id, t)
+            except Exception:
+                self.errors += 1
+                log.exception("Error procesando el frame %d", frame_id)
+                interval = self.scheduler.interval if self.scheduler is not None else 0.0
+                self._stop_event.wait(max(self.error_backoff, interval))
+                continue
+            self.processed += 1
+            self.results.put(result)
+            if self.scheduler is not None:
+                self.scheduler.record(result.latency, result.face_found or result.motion)
+                delay = self.scheduler.next_delay(result.latency)
+                if delay > 0:
+                    self._stop_event.wait(delay)  # el frame que llegue mientras tanto pisa a los anteriores
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class RecognitionPipeline:
+    # Arma captura + worker sobre un cv2.VideoCapture ya abierto (video_file / every_frame: ver FrameGrabber)
+    def __init__(self, cap, recognizer: FrameRecognizer, scheduler: Optional[AdaptiveScheduler] = None,
+                 video_file=False, every_frame=False):
+        self.cap = cap
+        self.recognizer = recognizer
+        self.scheduler = scheduler if scheduler is not None else AdaptiveScheduler()
+        self.results: "queue.Queue[RecognitionResult]" = queue.Queue()
+        self._slot = LatestFrameSlot()
+        self.grabber = FrameGrabber(cap, self._slot, video_file=video_file, every_frame=every_frame)
+        self.worker = RecognitionWorker(self._slot, recognizer, self.results, self.scheduler)
+
+    def start(self):
+        self.grabber.start()
+        self.worker.start()
+
+    def stop(self, timeout=2.0):
+        self.grabber.stop()
+        self.worker.stop()
+        self._slot.close()
+        self.grabber.join(timeout)
+        self.worker.join(timeout)
+        if self.cap is not None:
+            if not self.grabber.release_when_done():
+                log.warning("La captura no respondió en %.1fs; se libera cuando termine la lectura en curso", timeout)
+            self.cap = None
+
+    @property
+    def ended(self):
+        return self.grabber.ended
+
+    def clock(self):
+        # Reloj de la fuente para vencer ausencias: el del video en archivos, el de pared en cámaras
+        if self.grabber.video_file and self.grabber.clock is not None:
+            return self.grabber.clock
+        return time.time()
+
+    @property
+    def dropped_frames(self):
+        return self._slot.dropped
+
+    def latest_frame(self):
+        # (frame_id, timestamp, frame) o None si todavía no llegó ninguno
+        return self.grabber.latest()
+
+    def drain_results(self) -> List[RecognitionResult]:
+        out = []
+        while True:
+            try:
+                out.append(self.results.get_nowait())
+            except queue.Empty:
+                return out
@@ -0,0 +1,251 @@
+# recognize_daemon.py
+# Reconocimiento de asistencia sin interfaz gráfica, para las terminales de las puertas.
+# No importa customtkinter / Pillow / Tk: procesa los frames a la velocidad que dé la CPU,
+# registra entradas/salidas en SQLite y loguea contadores periódicamente.
+#
+# Ejecutar:
+#   python -m src.recognize_daemon --source 0
+#   python -m src.recognize_daemon --source 0 --source rtsp://10.0.0.12/stream --pool process
+#   recognize-daemon --source video_prueba.mp4        (si se instaló con pip install -e .)
+
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+from . import utils_db
+from . import utils_recognition as u_rec
+from .cameras import CameraManager, make_recognition_pool
+from .recognition_pipeline import KEYFRAME_INTERVAL, MOTION_METHODS, TRACKER_KINDS, parse_roi
+from .attendance_writer import AttendanceWriter, AttendanceWriterError
+
+log = logging.getLogger("recognize_daemon")
+
+
+@dataclass
+class DaemonCounters:
+    entradas: int = 0
+    salidas: int = 0
+    db_errors: int = 0
+    frames_processed: int = 0
+    faces_seen: int = 0
+    matches: int = 0
+    unknown_faces: int = 0
+
+
+def load_gallery(images_path=utils_db.PYME_EMPLOYEES_IMAGES, db_path=utils_db.PYME_DB):
+    u_rec._save_encodings_if_necessary(images_path)
+    u_rec.sync_encodings_to_db(images_path, db_path)
+    return u_rec.DbGallery(db_path)
+
+
+class RecognizeDaemon:
+    def __init__(self, sources, db_path=utils_db.PYME_DB, images_path=utils_db.PYME_EMPLOYEES_IMAGES,
+                 pool_kind="thread", workers=None, tolerance=u_rec.EUCLIDEAN_DISTANCE_TOLERANCE,
+                 strategy="min", min_votes=1, stats_interval=30.0, gallery_refresh_interval=5.0,
+                 state_dir=None, snapshot_interval=10.0, tracker="kcf", keyframe_interval=KEYFRAME_INTERVAL,
+                 cpu_budget=0.5, idle_budget=0.1, motion="mog2", roi=None, detector=None, every_frame=False):
+        self.db_path = db_path
+        self.images_path = images_path
+        self.stats_interval = stats_interval
+        self.gallery_refresh_interval = gallery_refresh_interval
+        # Snapshots de presencia: por defecto junto a la base
+        self.state_dir = state_dir or os.path.dirname(os.path.abspath(db_path))
+        self.snapshot_interval = snapshot_interval
+        self.counters = DaemonCounters()
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._last_stats = time.monotonic()
+        self._last_gallery_refresh = time.monotonic()
+        self._last_snapshot = time.monotonic()
+
+        utils_db.ensure_db_seeded(db_path)
+        self.db_gallery = load_gallery(images_path, db_path)
+        gallery = self.db_gallery.index
+        log.info("Galería cargada: %d encodings de %d empleados", len(gallery), len(gallery.employees))
+
+        self.writer = AttendanceWriter(db_path, on_written=self._on_attendance_written)
+        self.pool = make_recognition_pool(pool_kind, workers)
+        self.cameras = CameraManager(
+            sources, gallery, on_event=self._on_presence_event, pool=self.pool,
+            tolerance=tolerance, strategy=strategy, min_votes=min_votes,
+            tracker=tracker, keyframe_interval=keyframe_interval,
+            cpu_budget=cpu_budget, idle_budget=idle_budget, motion=motion, roi=roi, detector=detector,
+            every_frame=every_frame,
+        )
+        # Arranque en caliente: presencias/cooldowns del último snapshot + turnos abiertos en la DB,
+        # así un reinicio no repite entradas
+        start = time.perf_counter()
+        restored, warmed = self.cameras.load_presence(self.state_dir, utils_db.load_open_shifts(db_path))
+        log.info("Presencia restaurada en %.3fs: %d snapshots, %d turnos abiertos",
+                 time.perf_counter() - start, restored, warmed)
+
+    def _on_presence_event(self, stream, evento, legajo, t):
+        log.debug("[%s] Legajo %s: %s detectada", stream, legajo, evento)
+        try:
+            self.writer.submit(legajo, t, evento)
+        except AttendanceWriterError:
+            # Sin base no tiene sentido seguir reconociendo: se corta el daemon
+            log.error("Legajo %s: %s no registrada, el writer de asistencias está caído; se detiene el daemon",
+                      legajo, evento)
+            self.stop()
+
+    def _on_attendance_written(self, evento, legajo, t):
+        # Hilo del AttendanceWriter, después del commit del lote
+        with self._lock:
+            if evento == "entrada":
+                self.counters.entradas += 1
+            else:
+                self.counters.salidas += 1
+        log.info("Legajo %s: %s registrada a las %s", legajo, evento.upper(),
+                 utils_db.get_timestamp_from_posix_version(t))
+
+    def _on_results(self, stream, results):
+        with self._lock:
+            for r in results:
+                self.counters.frames_processed += 1
+                if r.face_found:
+                    self.counters.faces_seen += 1
+                if r.matches:
+                    self.counters.matches += len(r.matches)
+                elif r.encoded:
+                    self.counters.unknown_faces += 1
+                if r.multiple_faces:
+                    log.debug("[%s] Múltiples caras en el frame %d", stream, r.frame_id)
+        now = time.monotonic()
+        if now - self._last_gallery_refresh >= self.gallery_refresh_interval:
+            # Altas/mapeos hechos desde otra terminal: sólo se leen las filas que cambiaron
+            self._last_gallery_refresh = now
+            if self.db_gallery.refresh():
+                self.cameras.set_gallery(self.db_gallery.index)
+                log.info("Galería actualizada: %d encodings", len(self.db_gallery.index))
+        if now - self._last_snapshot >= self.snapshot_interval:
+            self._last_snapshot = now
+            self.save_presence()
+        if now - self._last_stats >= self.stats_interval:
+            self._last_stats = now
+            self.log_stats()
+
+    def save_presence(self):
+        try:
+            self.cameras.save_presence(self.state_dir)
+        except OSError:
+            log.exception("No se pudo guardar el snapshot de presencia en %s", self.state_dir)
+
+    def snapshot_counters(self):
+        with self._lock:
+            self.counters.db_errors = self.writer.errors
+            return asdict(self.counters)
+
+    def log_stats(self):
+        log.info("Contadores: %s", self.snapshot_counters())
+        for st in self.cameras.stats():
+            log.info("[%s] capturados=%d (%.1f fps) procesados=%d (%.1f fps) keyframes=%d descartados=%d "
+                     "sin movimiento=%d latencia=%.1fms intervalo=%.0fms",
+                     st.name, st.frames_captured, st.capture_fps, st.frames_processed,
+                     st.processed_fps, st.keyframes, st.frames_dropped, st.frames_gated,
+                     st.latency_ms, st.interval_ms)
+
+    def run(self):
+        self.writer.start()
+        try:
+            self.cameras.run_headless(stop_event=self.stop_event, on_results=self._on_results)
+        finally:
+            self.save_presence()
+            self.writer.stop()
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.db_gallery.close()
+            self.log_stats()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Reconocimiento facial de asistencia sin interfaz gráfica")
+    parser.add_argument("--source", action="append", dest="sources",
+                        help="Índice de cámara, archivo de video o URL. Repetir para varias puertas (default: 0)")
+    parser.add_argument("--db", default=utils_db.PYME_DB, help="Ruta a la base SQLite")
+    parser.add_argument("--images", default=utils_db.PYME_EMPLOYEES_IMAGES, help="Carpeta con las fotos de empleados")
+    parser.add_argument("--pool", choices=("thread", "process"), default="thread",
+                        help="Pool compartido de reconocimiento (default: thread)")
+    parser.add_argument("--workers", type=int, default=None, help="Workers del pool (default: cantidad de CPUs)")
+    parser.add_argument("--tolerance", type=float, default=u_rec.EUCLIDEAN_DISTANCE_TOLERANCE)
+    parser.add_argument("--strategy", choices=u_rec.MATCH_STRATEGIES, default="min")
+    parser.add_argument("--min-votes", type=int, default=1, help="Fotos que tienen que coincidir con --strategy vote")
+    parser.add_argument("--tracker", choices=TRACKER_KINDS + ("none",), default="kcf",
+                        help="Tracker de OpenCV entre keyframes; none = detectar en cada frame (default: kcf)")
+    parser.add_argument("--keyframe-interval", type=float, default=KEYFRAME_INTERVAL,
+                        help="Segundos entre detecciones completas mientras se siguen caras")
+    parser.add_argument("--detector", choices=u_rec.DETECTOR_BACKENDS, default="hog",
+                        help="Detector de caras (medir con python -m src.detector_benchmark; default: hog)")
+    parser.add_argument("--detector-scale", type=float, default=1.0,
+                        help="Escala de entrada del detector, relativa al frame reducido del encoding (default: 1)")
+    parser.add_argument("--upsample", type=int, default=1, help="Upsample del detector HOG (default: 1)")
+    parser.add_argument("--motion", choices=MOTION_METHODS + ("none",), default="mog2",
+                        help="Filtro de movimiento antes de detectar caras; none = detectar siempre (default: mog2)")
+    parser.add_argument("--roi", type=parse_roi, default=None,
+                        help="Región a vigilar como x0,y0,x1,y1 en fracciones del frame (default: frame completo)")
+    parser.add_argument("--cpu-budget", type=float, default=0.5,
+                        help="Fracción de un núcleo por cámara para reconocimiento con actividad (default: 0.5)")
+    parser.add_argument("--idle-budget", type=float, default=0.1,
+                        help="Fracción de un núcleo por cámara con la escena quieta (default: 0.1)")
+    parser.add_argument("--every-frame", action="store_true",
+                        help="Con archivos de video: procesar todos los frames en vez de reproducir a velocidad real")
+    parser.add_argument("--stats-interval", type=float, default=30.0, help="Segundos entre logs de contadores")
+    parser.add_argument("--state-dir", default=None,
+                        help="Carpeta de los snapshots de presencia (default: la de la base)")
+    parser.add_argument("--snapshot-interval", type=float, default=10.0, help="Segundos entre snapshots de presencia")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    detector_kwargs = {"scale": args.detector_scale}
+    if args.detector == "hog":
+        detector_kwargs["upsample"] = args.upsample
+    try:
+        detector = u_rec.make_detector(args.detector, **detector_kwargs)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    daemon = RecognizeDaemon(
+        args.sources or ["0"],
+        db_path=args.db,
+        images_path=args.images,
+        pool_kind=args.pool,
+        workers=args.workers,
+        tolerance=args.tolerance,
+        strategy=args.strategy,
+        min_votes=args.min_votes,
+        stats_interval=args.stats_interval,
+        state_dir=args.state_dir,
+        snapshot_interval=args.snapshot_interval,
+        tracker=None if args.tracker == "none" else args.tracker,
+        keyframe_interval=args.keyframe_interval,
+        cpu_budget=args.cpu_budget,
+        idle_budget=args.idle_budget,
+        motion=None if args.motion == "none" else args.motion,
+        roi=args.roi,
+        detector=detector,
+        every_frame=args.every_frame,
+    )
+
+    def _handle_signal(signum, _frame):
+        log.info("Señal %s recibida, deteniendo...", signum)
+        daemon.stop()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
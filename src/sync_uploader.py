@@ -0,0 +1,201 @@
+# sync_uploader.py
+# Motor de subida del sync: manda los lotes en paralelo con una cantidad acotada de workers,
+# por etapas para respetar las FKs (todas las tablas de una etapa se suben antes de empezar la
+# siguiente), reintenta con backoff exponencial + jitter y ajusta el tamaño de lote según la
+# latencia y el peso de los lotes que van volviendo. Un lote rechazado por los datos se parte en
+# mitades hasta aislar las filas malas; de las etapas siguientes sólo se saltan las filas que
+# apuntan a esas filas. El transporte es cualquier objeto con
+# upsert(table, rows, on_conflict) que lance una excepción si el servidor no confirmó el lote.
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+log = logging.getLogger("sync_uploader")
+
+
+# Clases de SQLSTATE que no se arreglan reintentando: datos inválidos, constraints/FK,
+# sintaxis/permisos, WITH CHECK OPTION
+PG_PERMANENT_CLASSES = ("22", "23", "42", "44")
+
+
+def is_retryable(exc: Exception) -> bool:
+    # Errores del cliente (4xx: datos inválidos, FK, permisos) no se arreglan reintentando; sí los
+    # timeouts, 408/429, 5xx y errores de red. Mira .code (int en urllib; str con el SQLSTATE o el
+    # código PGRST en postgrest.APIError) o .status_code (httpx).
+    code = getattr(exc, "code", None)
+    if isinstance(code, str):
+        if code.startswith("PGRST"):
+            return code.startswith("PGRST0")  # PGRST0xx: PostgREST no llegó a la base (conexión, timeout)
+        if len(code) == 5 and code[:2] in PG_PERMANENT_CLASSES:
+            return False
+    status = code if isinstance(code, int) else getattr(exc, "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status not in (408, 429))
+
+
+@dataclass
+class UploadJob:
+    # items: [(clave, fila)]; la clave vuelve en TableStats.acked cuando el servidor confirma la fila
+    # parents: {tabla padre: columna de la fila con la clave del padre}. Se saltan sólo las filas
+    # cuyo padre no se subió; con None la tabla depende de todo lo anterior y se salta entera si
+    # algo falló.
+    table: str
+    on_conflict: str
+    items: List[Tuple[Any, Dict[str, Any]]]
+    parents: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class TableStats:
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0  # no se intentaron porque falló una etapa anterior (FKs)
+    batches: int = 0
+    retries: int = 0
+    acked: List[Any] = field(default_factory=list)
+    rejected: List[Any] = field(default_factory=list)  # claves de las filas que no se subieron
+
+
+class AdaptiveBatchSize:
+    # Duplica el lote mientras vuelvan rápido y livianos (menos de la mitad de target_latency y de
+    # max_payload); lo reduce a la mitad si un lote tarda más que target_latency, pesa más que
+    # max_payload o falla. Se comparte entre workers.
+    def __init__(self, initial=500, minimum=10, maximum=5000, target_latency=1.0, max_payload=1_000_000):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_payload = max_payload
+        self._value = max(minimum, min(maximum, initial))
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def observe(self, rows: int, latency: float, payload: int) -> None:
+        with self._lock:
+            if latency > self.target_latency or payload > self.max_payload:
+                self._value = max(self.minimum, self._value // 2)
+            elif rows >= self._value and latency < self.target_latency / 2 and payload < self.max_payload / 2:
+                self._value = min(self.maximum, self._value * 2)
+
+    def failed(self) -> None:
+        with self._lock:
+            self._value = max(self.minimum, self._value // 2)
+
+
+class BatchUploader:
+    def __init__(self, target, workers=4, retries=4, base_delay=0.5, max_delay=30.0,
+                 batch_size=None, sleep=time.sleep, retryable=is_retryable):
+        self.target = target
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size or AdaptiveBatchSize()
+        self.sleep = sleep
+        self.retryable = retryable
+        self._lock = threading.Lock()
+
+    def upload(self, stages: Sequence[Sequence[UploadJob]],
+               missing: Optional[Dict[str, Set[Any]]] = None) -> Dict[str, TableStats]:
+        # stages: [[UploadJob, ...], ...] en orden de FKs. Las filas cuyo padre no se subió
+        # (ver UploadJob.parents) no se intentan y quedan en skipped. missing: {tabla: claves que no
+        # se subieron} de llamadas anteriores; se completa con lo que falle o se salte en ésta.
+        stats: Dict[str, TableStats] = {}
+        missing = {} if missing is None else missing
+        for jobs in stages:
+            ready = []
+            for job in jobs:
+                st = stats.setdefault(job.table, TableStats())
+                items, skipped = self._split_by_parents(job, missing)
+                st.skipped += len(skipped)
+                missing.setdefault(job.table, set()).update(skipped)
+                if items:
+                    ready.append(UploadJob(job.table, job.on_conflict, items, job.parents))
+            self._run_stage(ready, stats)
+            for job in jobs:
+                missing[job.table].update(stats[job.table].rejected)
+        return stats
+
+    @staticmethod
+    def _split_by_parents(job, missing):
+        # (items a subir, claves salteadas)
+        if job.parents is None:
+            if any(missing.values()):
+                return [], [clave for clave, _ in job.items]
+            return job.items, []
+        items, skipped = [], []
+        for clave, row in job.items:
+            if any(row.get(col) in missing.get(parent, ()) for parent, col in job.parents.items()):
+                skipped.append(clave)
+            else:
+                items.append((clave, row))
+        return items, skipped
+
+    def _run_stage(self, jobs, stats):
+        if not jobs:
+            return
+        cursors = [0] * len(jobs)
+
+        def next_chunk():
+            # Próximo lote del tamaño vigente, tabla por tabla
+            with self._lock:
+                for i, job in enumerate(jobs):
+                    start = cursors[i]
+                    if start < len(job.items):
+                        cursors[i] = start + self.batch_size.value
+                        return job, job.items[start:cursors[i]]
+            return None
+
+        def worker():
+            while True:
+                work = next_chunk()
+                if work is None:
+                    return
+                self._send(*work, stats[work[0].table])
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sync-upload") as pool:
+            for future in [pool.submit(worker) for _ in range(self.workers)]:
+                future.result()
+
+    def _send(self, job, chunk, st):
+        rows = [row for _, row in chunk]
+        payload = len(json.dumps(rows, default=str))
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                self.target.upsert(job.table, rows, job.on_conflict)
+            except Exception as e:
+                self.batch_size.failed()
+                retryable = self.retryable(e)
+                if not retryable and len(chunk) > 1:
+                    # Rechazado por los datos: se parte en dos para subir las filas buenas
+                    log.info("%s: lote de %d filas rechazado (%s), se manda en dos mitades", job.table, len(rows), e)
+                    half = len(chunk) // 2
+                    self._send(job, chunk[:half], st)
+                    self._send(job, chunk[half:], st)
+                    return
+                if attempt == self.retries or not retryable:
+                    log.warning("%s: lote de %d filas descartado después de %d intentos: %s",
+                                job.table, len(rows), attempt + 1, e)
+                    with self._lock:
+                        st.failed += len(rows)
+                        st.rejected.extend(clave for clave, _ in chunk)
+                    return
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                log.info("%s: falló un lote de %d filas (%s), reintento en %.1fs", job.table, len(rows), e, delay)
+                with self._lock:
+                    st.retries += 1
+                self.sleep(delay)
+                continue
+            self.batch_size.observe(len(rows), time.perf_counter() - start, payload)
+            with self._lock:
+                st.sent += len(rows)
+                st.batches += 1
+                st.acked.extend(clave for clave, _ in chunk)
+            return
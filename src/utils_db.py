@@ -1,7 +1,12 @@
 import sqlite3
 import logging
+import threading
+import time
 from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+
+from .utils_files import legajo_from_filename
 
 PYME_DB = "./pyme_san_ignacio.db"
 PYME_EMPLOYEES_IMAGES = "./db_images/"
@@ -207,6 +212,14 @@ def create_database_pyme(cursor):
     )
     # 🔹 Nuevo: índice para mejorar consultas por legajo
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_asistencia_legajo ON asistencia_empleado(legajo_empleado)')
+    # Turnos abiertos: índice parcial (legajo_empleado, entrada) sólo con las filas sin salida,
+    # respalda la carga de OpenShifts. El orden por entrada lo cubre el índice del UNIQUE.
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_asistencia_abiertas'
+        ' ON asistencia_empleado(legajo_empleado, entrada) WHERE salida IS NULL'
+    )
+    create_face_encodings_tables(cursor)
+    create_sync_tables(cursor)
     cursor.execute(
         'CREATE TABLE IF NOT EXISTS productos_finales ('
         ' codigo TEXT PRIMARY KEY,'
@@ -258,6 +271,160 @@ def create_database_pyme(cursor):
         ' stock INTEGER NOT NULL)'
     )
 
+def create_face_encodings_tables(cursor):
+    # Encodings de cada foto de la base (128 float32 little-endian en BLOB).
+    # legajo: el del nombre del archivo si es numérico; si no, se toma el de rostros al consultar.
+    # version: valor de encodings_cambios.version cuando se escribió la fila (o cambió su mapeo en rostros),
+    # para poder leer sólo lo que cambió desde la última consulta.
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS rostros_encodings ('
+        ' archivo TEXT PRIMARY KEY,'
+        ' legajo INTEGER,'
+        ' modelo TEXT NOT NULL,'
+        ' sha1 TEXT NOT NULL,'
+        ' encoding BLOB NOT NULL,'
+        ' version INTEGER NOT NULL,'
+        ' FOREIGN KEY (legajo) REFERENCES empleados(legajo))'
+    )
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rostros_encodings_version ON rostros_encodings(version)')
+    # Contador de cambios: version sube con cada escritura, borrados con cada DELETE (obliga a recargar todo)
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS encodings_cambios ('
+        ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+        ' version INTEGER NOT NULL,'
+        ' borrados INTEGER NOT NULL)'
+    )
+    cursor.execute('INSERT OR IGNORE INTO encodings_cambios (id, version, borrados) VALUES (1, 0, 0)')
+    cursor.execute(
+        'CREATE TRIGGER IF NOT EXISTS trg_rostros_encodings_delete AFTER DELETE ON rostros_encodings '
+        'BEGIN UPDATE encodings_cambios SET borrados = borrados + 1 WHERE id = 1; END'
+    )
+    # Un cambio de mapeo en rostros también cuenta como cambio del encoding de ese archivo
+    for evento, fila in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS trg_rostros_{evento.lower()}_encodings AFTER {evento} ON rostros '
+            'BEGIN'
+            ' UPDATE encodings_cambios SET version = version + 1 WHERE id = 1;'
+            f' UPDATE rostros_encodings SET version = (SELECT version FROM encodings_cambios WHERE id = 1) WHERE archivo = {fila}.archivo;'
+            ' END'
+        )
+
+# Tablas que se suben a Supabase, en orden de FKs: (clave primaria, columnas cuyo cambio hay que volver a enviar)
+SYNCED_TABLES = {
+    "empleados": ("legajo", ("nombre", "puesto", "area")),
+    "rostros": ("archivo", ("legajo",)),
+    "asistencia_empleado": ("id", ("legajo_empleado", "entrada", "salida")),
+}
+
+def create_sync_tables(cursor):
+    # Outbox del sync: los triggers agregan (tabla, clave) por cada INSERT o UPDATE de las tablas
+    # sincronizadas; el sync lo vacía en orden de id y borra lo que el servidor confirmó. Una fila
+    # modificada varias veces aparece varias veces: se sube una sola vez con su estado actual.
+    # sync_state guarda por tabla el watermark: todo lo anotado para esa tabla con id <= watermark
+    # ya está confirmado por el servidor (0 = nada todavía).
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_outbox'")
+    nueva = cursor.fetchone() is None
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS sync_outbox ('
+        ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+        ' tabla TEXT NOT NULL,'
+        ' clave NOT NULL)'
+    )
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS sync_state ('
+        ' tabla TEXT PRIMARY KEY,'
+        ' watermark INTEGER NOT NULL,'
+        ' actualizado TIMESTAMP)'
+    )
+    for tabla, (clave, columnas) in SYNCED_TABLES.items():
+        cursor.execute('INSERT OR IGNORE INTO sync_state (tabla, watermark) VALUES (?, 0)', (tabla,))
+        for evento in ("INSERT", f"UPDATE OF {', '.join(columnas)}"):
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS trg_{tabla}_{evento.split()[0].lower()}_outbox AFTER {evento} ON {tabla} '
+                f"BEGIN INSERT INTO sync_outbox (tabla, clave) VALUES ('{tabla}', NEW.{clave}); END"
+            )
+    if nueva:
+        # Lo que ya estaba en la base entra en el primer sync
+        enqueue_all_for_sync(cursor)
+
+def enqueue_all_for_sync(cursor):
+    # Encola todas las filas (backfill del outbox recién creado), en orden de FKs
+    for tabla, (clave, _) in SYNCED_TABLES.items():
+        cursor.execute(f'INSERT INTO sync_outbox (tabla, clave) SELECT ?, {clave} FROM {tabla} ORDER BY rowid', (tabla,))
+
+def get_outbox_batch(cursor, after_id: int, limit: int):
+    # Próximas entradas del outbox: [(id, tabla, clave)] en orden de id
+    cursor.execute('SELECT id, tabla, clave FROM sync_outbox WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit))
+    return cursor.fetchall()
+
+def delete_outbox_entries(cursor, ids):
+    cursor.executemany('DELETE FROM sync_outbox WHERE id = ?', [(i,) for i in ids])
+
+def delete_outbox_through(cursor, max_id: int):
+    cursor.execute('DELETE FROM sync_outbox WHERE id <= ?', (max_id,))
+
+def get_outbox_max_id(cursor):
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM sync_outbox')
+    return cursor.fetchone()[0]
+
+def update_sync_watermarks(cursor):
+    # Después de borrar lo confirmado: el watermark de cada tabla queda justo antes de su entrada
+    # pendiente más vieja, o en el último id emitido si no le queda ninguna
+    cursor.execute(
+        'UPDATE sync_state SET actualizado = CURRENT_TIMESTAMP, watermark = MAX(watermark, COALESCE('
+        ' (SELECT MIN(id) - 1 FROM sync_outbox WHERE sync_outbox.tabla = sync_state.tabla),'
+        " (SELECT seq FROM sqlite_sequence WHERE name = 'sync_outbox'), 0))"
+    )
+
+def get_sync_state(cursor):
+    # {tabla: (watermark, actualizado)}
+    cursor.execute('SELECT tabla, watermark, actualizado FROM sync_state')
+    return {tabla: (watermark, actualizado) for tabla, watermark, actualizado in cursor.fetchall()}
+
+def count_outbox(cursor):
+    cursor.execute('SELECT COUNT(*) FROM sync_outbox')
+    return cursor.fetchone()[0]
+
+def iter_cursor(cursor, size: int = 500):
+    # Filas de la última consulta de a size por vez (fetchmany), sin armar la lista completa
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+def iter_rows_by_key(conn, tabla: str, columnas: str, claves, chunk: int = 500):
+    # Estado actual de las filas anotadas, como sqlite3.Row con la clave en "_clave". Las que ya no
+    # existen no vuelven. Las claves van de a chunk por consulta (límite de parámetros de SQLite).
+    clave = SYNCED_TABLES[tabla][0]
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    claves = iter(claves)
+    while parte := list(islice(claves, chunk)):
+        marcas = ", ".join("?" * len(parte))
+        cursor.execute(f'SELECT {clave} AS _clave, {columnas} FROM {tabla} WHERE {clave} IN ({marcas})', parte)
+        yield from iter_cursor(cursor, chunk)
+
+def iter_table_rows(conn, tabla: str, columnas: str, page: int = 500):
+    # Toda la tabla en orden de clave, paginada por keyset (clave > la última de la página anterior):
+    # cada consulta es corta y no retiene un snapshot de lectura mientras se sube. Filas sqlite3.Row
+    # con la clave en "_clave".
+    clave = SYNCED_TABLES[tabla][0]
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f'SELECT {clave} AS _clave, {columnas} FROM {tabla} ORDER BY {clave} LIMIT ?', (page,))
+    while True:
+        ultima = None
+        for row in iter_cursor(cursor, page):
+            ultima = row["_clave"]
+            yield row
+        if ultima is None:
+            return
+        cursor.execute(
+            f'SELECT {clave} AS _clave, {columnas} FROM {tabla} WHERE {clave} > ? ORDER BY {clave} LIMIT ?',
+            (ultima, page),
+        )
+
 def manual_load_empleados(cursor, empleados_list):
     cursor.executemany(
         'INSERT OR IGNORE INTO empleados (legajo, nombre, puesto, area) VALUES (?, ?, ?, ?)',
@@ -322,15 +489,18 @@ def ensure_db_seeded(db_path: str = PYME_DB):
 def get_timestamp_from_posix_version(posix_timestamp, _format="%Y-%m-%d %H:%M:%S"):
     return datetime.fromtimestamp(posix_timestamp).strftime(_format)
 
+def get_posix_from_timestamp(timestamp: str, _format="%Y-%m-%d %H:%M:%S"):
+    return datetime.strptime(timestamp, _format).timestamp()
+
 def report_empleado_entrada(cursor, legajo: int, timestamp):
     cursor.execute("INSERT INTO asistencia_empleado (legajo_empleado, entrada, salida) VALUES (?,?,NULL)", (legajo, timestamp))
 
 def report_empleado_salida(cursor, legajo: int, timestamp, entrada=None):
     if entrada is None:
-        cursor.execute("SELECT entrada FROM asistencia_empleado WHERE legajo_empleado = ? ORDER BY entrada DESC LIMIT 1")
-        entrada = cursor.fetchone()
+        cursor.execute("SELECT entrada FROM asistencia_empleado WHERE legajo_empleado = ? ORDER BY entrada DESC LIMIT 1", (legajo,))
+        row = cursor.fetchone()
         if not row:
-            logging.warning(f"No se encontró entrada previa para el empleado con legajo {legajo_empleado}")
+            logging.warning(f"No se encontró entrada previa para el empleado con legajo {legajo}")
             return
         entrada = row[0]
     cursor.execute("UPDATE asistencia_empleado SET salida = ? WHERE legajo_empleado = ? AND entrada = ?",(timestamp, legajo, entrada))
@@ -342,27 +512,187 @@ def get_last_assistance_empleado(cursor, legajo):
         return  None, None
     return row
 
-def empleado_detected(cursor, legajo: int, timestamp: float):
+def get_open_shifts(cursor):
+    # {legajo: entrada} de los empleados cuya última asistencia no tiene salida
+    cursor.execute(
+        "SELECT a.legajo_empleado, a.entrada FROM asistencia_empleado a"
+        " WHERE a.salida IS NULL AND a.entrada ="
+        " (SELECT MAX(entrada) FROM asistencia_empleado WHERE legajo_empleado = a.legajo_empleado)"
+    )
+    return dict(cursor.fetchall())
+
+def load_open_shifts(db_path: str = PYME_DB):
+    # {legajo: entrada (posix)}, para arrancar el PresenceManager con los que ya están adentro
+    with get_connection(db_path) as conn:
+        return {legajo: get_posix_from_timestamp(entrada) for legajo, entrada in get_open_shifts(conn.cursor()).items()}
+
+class OpenShifts:
+    # Turnos abiertos en memoria (legajo -> entrada), para decidir entrada/salida sin consultar la DB.
+    # Se carga con una sola consulta y se actualiza write-through desde empleado_detected.
+    # sync() recarga si otra conexión escribió la base (PRAGMA data_version); después de un
+    # rollback hay que llamar a reload(), porque la tabla ya refleja lo que no se confirmó.
+    def __init__(self):
+        self._open = {}
+        self._data_version = None
+
+    def reload(self, cursor):
+        self._open = get_open_shifts(cursor)
+        cursor.execute('PRAGMA data_version')
+        self._data_version = cursor.fetchone()[0]
+
+    def sync(self, cursor):
+        cursor.execute('PRAGMA data_version')
+        if cursor.fetchone()[0] != self._data_version:
+            self.reload(cursor)
+
+    def get(self, legajo: int):
+        return self._open.get(legajo)
+
+    def opened(self, legajo: int, entrada):
+        self._open[legajo] = entrada
+
+    def closed(self, legajo: int):
+        self._open.pop(legajo, None)
+
+    def __len__(self):
+        return len(self._open)
+
+def empleado_detected(cursor, legajo: int, timestamp: float, shifts: OpenShifts = None, evento: str = None):
+    # Sin evento alterna entrada/salida según el último registro. Con evento ("entrada"/"salida",
+    # lo que decidió el PresenceManager) sólo se registra si es coherente con el turno abierto:
+    # una entrada con turno abierto o una salida sin turno se ignoran y devuelve None.
     timestamp = get_timestamp_from_posix_version(timestamp)
-    entrada, salida = get_last_assistance_empleado(cursor, legajo)
-    if entrada is None or salida is not None: # Registar nueva entrada
+    if shifts is not None:
+        entrada = shifts.get(legajo)
+    else:
+        entrada, salida = get_last_assistance_empleado(cursor, legajo)
+        if salida is not None:
+            entrada = None
+    if entrada is None: # Registar nueva entrada
+        if evento == "salida":
+            logging.info("Salida ignorada: el empleado no tiene un turno abierto")
+            return None
         report_empleado_entrada(cursor, legajo, timestamp)
+        if shifts is not None:
+            shifts.opened(legajo, timestamp)
         logging.info("Registrada entrada de empleado")
+        return "entrada"
     else: # Registar nueva salida
+        if evento == "entrada":
+            logging.info("Entrada ignorada: el empleado ya tiene un turno abierto")
+            return None
         report_empleado_salida(cursor, legajo, timestamp, entrada)
+        if shifts is not None:
+            shifts.closed(legajo)
         logging.info("Registrada salida de empleado")
+        return "salida"
+
+# Sube cada vez que este proceso modifica rostros; invalida los LegajoLookup sin consultar la DB
+_face_mapping_generation = 0
 
 def add_face_mapping(cursor, archivo: str, legajo: int):
+    global _face_mapping_generation
     cursor.execute('INSERT OR REPLACE INTO rostros (archivo, legajo) VALUES (?, ?)', (archivo, legajo))
+    _face_mapping_generation += 1
 
 def set_face_mapping_bulk(cursor, pairs):
+    global _face_mapping_generation
     cursor.executemany('INSERT OR REPLACE INTO rostros (archivo, legajo) VALUES (?, ?)', pairs)
+    _face_mapping_generation += 1
 
 def get_legajo_for_filename(cursor, archivo: str):
     cursor.execute('SELECT legajo FROM rostros WHERE archivo = ?', (archivo,))
     row = cursor.fetchone()
     return row[0] if row else None
 
+def get_face_mappings(cursor):
+    cursor.execute('SELECT archivo, legajo FROM rostros')
+    return dict(cursor.fetchall())
+
+class LegajoLookup:
+    # archivo -> legajo en memoria: nombre numérico o tabla rostros, cargada una sola vez.
+    # Se recarga si este proceso llamó a add_face_mapping/set_face_mapping_bulk, o si otra conexión
+    # escribió la base (PRAGMA data_version, revisado como mucho cada check_interval segundos).
+    # Se puede pasar directo como resolve_legajo de GalleryIndex.
+    def __init__(self, db_path: str = PYME_DB, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._mappings = {}
+        self._generation = None
+        self._data_version = None
+        self._checked_at = 0.0
+
+    def _refresh_if_needed(self):
+        now = time.monotonic()
+        stale = self._generation != _face_mapping_generation
+        if not stale and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        cur = self._conn.cursor()
+        cur.execute('PRAGMA data_version')
+        data_version = cur.fetchone()[0]
+        if not stale and data_version == self._data_version:
+            return
+        self._generation = _face_mapping_generation
+        self._data_version = data_version
+        try:
+            self._mappings = get_face_mappings(cur)
+        except sqlite3.OperationalError:  # base sin tabla rostros todavía
+            self._mappings = {}
+
+    def get(self, archivo: str):
+        leg = legajo_from_filename(archivo)
+        if leg is not None:
+            return leg
+        with self._lock:
+            self._refresh_if_needed()
+            return self._mappings.get(archivo)
+
+    __call__ = get
+
+    def invalidate(self):
+        with self._lock:
+            self._generation = None
+
+    def close(self):
+        self._conn.close()
+
+def get_face_encodings_state(cursor):
+    # (version, borrados) del contador de cambios de rostros_encodings
+    cursor.execute('SELECT version, borrados FROM encodings_cambios WHERE id = 1')
+    row = cursor.fetchone()
+    return tuple(row) if row else (0, 0)
+
+def get_face_encoding_hashes(cursor):
+    # {archivo: (modelo, sha1)} para saber qué filas hay que reescribir
+    cursor.execute('SELECT archivo, modelo, sha1 FROM rostros_encodings')
+    return {archivo: (modelo, sha1) for archivo, modelo, sha1 in cursor.fetchall()}
+
+def upsert_face_encodings(cursor, modelo: str, rows):
+    # rows: [(archivo, legajo | None, sha1, encoding_bytes)]
+    cursor.execute('UPDATE encodings_cambios SET version = version + 1 WHERE id = 1')
+    cursor.executemany(
+        'INSERT INTO rostros_encodings (archivo, legajo, modelo, sha1, encoding, version) '
+        'VALUES (?, ?, ?, ?, ?, (SELECT version FROM encodings_cambios WHERE id = 1)) '
+        'ON CONFLICT(archivo) DO UPDATE SET legajo = excluded.legajo, modelo = excluded.modelo,'
+        ' sha1 = excluded.sha1, encoding = excluded.encoding, version = excluded.version',
+        [(archivo, legajo, modelo, sha1, encoding) for archivo, legajo, sha1, encoding in rows],
+    )
+
+def delete_face_encodings(cursor, archivos):
+    cursor.executemany('DELETE FROM rostros_encodings WHERE archivo = ?', [(a,) for a in archivos])
+
+def get_face_encodings_since(cursor, modelo: str, version: int = 0):
+    # Una sola consulta ya cruzada con rostros: [(archivo, legajo | None, encoding_bytes)]
+    cursor.execute(
+        'SELECT e.archivo, COALESCE(e.legajo, r.legajo), e.encoding '
+        'FROM rostros_encodings e LEFT JOIN rostros r ON r.archivo = e.archivo '
+        'WHERE e.modelo = ? AND e.version > ? ORDER BY e.archivo',
+        (modelo, version),
+    )
+    return cursor.fetchall()
+
 def get_asistencia_por_dia(cursor, fecha: str):
     cursor.execute(
         "SELECT legajo_empleado, entrada, salida FROM asistencia_empleado "
@@ -370,6 +700,11 @@ def get_asistencia_por_dia(cursor, fecha: str):
     )
     return cursor.fetchall()
 
+def get_nombres_empleados(cursor):
+    # {legajo: nombre}
+    cursor.execute("SELECT legajo, nombre FROM empleados")
+    return dict(cursor.fetchall())
+
 def get_empleados_por_area(cursor, area: str):
     cursor.execute("SELECT legajo, nombre, puesto FROM empleados WHERE area = ?", (area,))
     return cursor.fetchall()
@@ -1,4 +1,6 @@
+import os
 import os.path
+import tempfile
 
 ACCEPTABLE_IMAGE_EXTENSIONS = ["jpg", "jpeg", "png", "webp", "bmp"]
 
@@ -9,4 +11,25 @@ def is_valid_image_extension(ext):
     return ext in ACCEPTABLE_IMAGE_EXTENSIONS
 
 def is_valid_image(file_name):
-    return is_valid_image_extension(get_file_extension(file_name))
\ No newline at end of file
+    return is_valid_image_extension(get_file_extension(file_name))
+
+def legajo_from_filename(file_name):
+    # "123.jpg" -> 123; cualquier otro nombre -> None
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    return int(base) if base.isdigit() else None
+
+def atomic_write(path, write, mode="wb"):
+    # Escritura atómica: archivo temporal en la misma carpeta + os.replace
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, mode=mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -1,7 +1,20 @@
+import cv2
 import face_recognition
+import hashlib
+import json
+import logging
+import numpy as np
 import pickle
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from . import utils_files
+from . import utils_db
+from .utils_files import atomic_write, legajo_from_filename
+
+log = logging.getLogger("utils_recognition")
 
 class MultipleFacesDetectedException(Exception):
     def __init__(self):
@@ -9,37 +22,364 @@ class MultipleFacesDetectedException(Exception):
 
 ENCODINGS_FILE = ".already_computed_face_encodings.pkl"
 
+ENCODING_DIM = 128
+
+# Identifica el modelo que generó los encodings guardados en la DB (si cambia, se regeneran las filas)
+ENCODING_MODEL = "dlib_resnet_v1"
+
 ACCEPTABLE_IMAGE_EXTENSIONS = ["jpg", "jpeg", "png", "webp", "bmp"]
 
 EUCLIDEAN_DISTANCE_TOLERANCE = 0.6
 
+# Estrategias para decidir un match por empleado (agrupando todas sus fotos)
+# - "min": distancia mínima entre todas sus fotos
+# - "centroid": distancia al promedio de sus encodings
+# - "vote": al menos min_votes fotos dentro de la tolerancia (k-of-n)
+MATCH_STRATEGIES = ("min", "centroid", "vote")
+
 def get_encodings_file_path(database_path):
     return os.path.join(database_path, ENCODINGS_FILE)
 
-def get_saved_encodings(database_path):
-    _enc_file = get_encodings_file_path(database_path)
-    if not os.path.exists(_enc_file):
-        return {}
+# Formato del cache (versión 2):
+#   {"version": 2, "entries": {archivo: {"sha1": str, "mtime_ns": int, "size": int, "encoding": vector | None}}}
+# La versión 1 (dict plano archivo -> encoding) se migra sola la próxima vez que se actualiza.
+_CACHE_VERSION = 2
+
+# Cache en memoria del pickle ya leído, invalidado por (mtime_ns, size) del archivo en disco
+_cache_memo = {}
+_cache_lock = threading.Lock()
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_cache_file(enc_file):
     try:
-        with open(_enc_file, mode="rb") as f:
-            return pickle.load(f)
-    except EOFError:
+        with open(enc_file, mode="rb") as f:
+            data = pickle.load(f)
+    except (EOFError, pickle.UnpicklingError):
         return {}
+    if isinstance(data, dict) and data.get("version") == _CACHE_VERSION:
+        return data["entries"]
+    # Formato viejo: sin hash ni stat, se completan en la próxima actualización
+    return {
+        fname: {"sha1": None, "mtime_ns": None, "size": None, "encoding": enc}
+        for fname, enc in data.items()
+    }
+
+def _load_cache_entries(database_path):
+    enc_file = get_encodings_file_path(database_path)
+    sig = _file_signature(enc_file)
+    if sig is None:
+        return {}, {}
+    key = os.path.abspath(enc_file)
+    with _cache_lock:
+        memo = _cache_memo.get(key)
+        if memo is not None and memo[0] == sig:
+            return memo[1], memo[2]
+    entries = _read_cache_file(enc_file)
+    flat = {fname: e["encoding"] for fname, e in entries.items()}
+    with _cache_lock:
+        _cache_memo[key] = (sig, entries, flat)
+    return entries, flat
+
+def get_saved_encodings(database_path):
+    # dict[archivo, vector | None]. No modificar el resultado: es compartido por el cache en memoria
+    return _load_cache_entries(database_path)[1]
 
-def _set_new_encodings(encodings, database_path):
-    with open(get_encodings_file_path(database_path), mode="wb") as f:
-            pickle.dump(encodings, f)
+def _write_cache(entries, database_path):
+    enc_file = get_encodings_file_path(database_path)
+    atomic_write(enc_file, lambda f: pickle.dump({"version": _CACHE_VERSION, "entries": entries}, f, protocol=pickle.HIGHEST_PROTOCOL))
+    sig = _file_signature(enc_file)
+    flat = {fname: e["encoding"] for fname, e in entries.items()}
+    with _cache_lock:
+        _cache_memo[os.path.abspath(enc_file)] = (sig, entries, flat)
 
-def _save_encodings_if_necessary(database_path):
-    images = os.listdir(database_path)
-    if not images:
+# Encoding en paralelo: imágenes por tarea del ProcessPool y mínimo de pendientes para levantar el pool
+ENCODING_CHUNK_SIZE = 4
+PARALLEL_MIN_IMAGES = 8
+
+# Serializa las actualizaciones del cache dentro del proceso (GUI: hilo de fondo + acciones del usuario)
+_update_lock = threading.Lock()
+
+def _encode_paths(paths):
+    # Corre dentro del ProcessPool: [(path, encoding | None)]. Una foto con varias caras, corrupta o
+    # ilegible queda sin encoding (sale en el chequeo de imágenes problemáticas) en vez de cortar la carga
+    out = []
+    for path in paths:
+        try:
+            out.append((path, get_face_encoding(path)))
+        except MultipleFacesDetectedException:
+            out.append((path, None))
+        except Exception as e:
+            log.warning("No se pudo leer la imagen %s: %s", path, e)
+            out.append((path, None))
+    return out
+
+def _iter_encoded(paths, max_workers, chunk_size):
+    # Genera (path, encoding) a medida que se terminan, en paralelo si vale la pena
+    if max_workers == 1 or len(paths) < PARALLEL_MIN_IMAGES:
+        for path in paths:
+            yield from _encode_paths([path])
         return
-    encodings = get_saved_encodings(database_path)
-    for image in images:
-        if not utils_files.is_valid_image(image) or image in encodings:
-            continue
-        encodings[image] = get_face_encoding(os.path.join(database_path, image))
-    _set_new_encodings(encodings, database_path)
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_encode_paths, chunk) for chunk in chunks]
+        try:
+            for fut in as_completed(futures):
+                yield from fut.result()
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+def _save_encodings_if_necessary(database_path, max_workers=None, chunk_size=ENCODING_CHUNK_SIZE, progress=None):
+    # Actualización incremental: sólo se lee/hashea un archivo si cambió su (mtime, size), sólo se
+    # calcula el encoding si cambió su contenido (sha1), se eliminan las fotos borradas y el pickle
+    # se reescribe únicamente si algo cambió. Sin cambios el costo es un scandir + stats.
+    # Las fotos nuevas se codifican en un ProcessPool (max_workers=None -> cantidad de CPUs) y el cache
+    # se guarda después de cada bloque terminado, así una corrida interrumpida retoma donde quedó.
+    # progress(hechas, total) se llama desde el hilo que ejecuta esta función.
+    with _update_lock:
+        cached, _ = _load_cache_entries(database_path)
+        entries = dict(cached)
+        by_hash = {e["sha1"]: e["encoding"] for e in entries.values() if e["sha1"] is not None}
+        changed = False
+        seen = set()
+        pending = {}  # path -> (archivo, sha1, stat)
+        with os.scandir(database_path) as it:
+            for de in it:
+                if not de.is_file() or not utils_files.is_valid_image(de.name):
+                    continue
+                seen.add(de.name)
+                st = de.stat()
+                entry = entries.get(de.name)
+                if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    continue
+                digest = _file_digest(de.path)
+                if entry is not None and entry["sha1"] in (digest, None):
+                    # Mismo contenido (o cache viejo sin hash): se conserva el encoding, sólo se actualiza el stat
+                    encoding = entry["encoding"]
+                elif digest in by_hash:
+                    # Foto copiada/renombrada: el encoding ya se conoce por su contenido
+                    encoding = by_hash[digest]
+                else:
+                    entries.pop(de.name, None)
+                    pending[de.path] = (de.name, digest, st)
+                    continue
+                entries[de.name] = {"sha1": digest, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "encoding": encoding}
+                by_hash[digest] = encoding
+                changed = True
+        for fname in [f for f in entries if f not in seen]:
+            del entries[fname]
+            changed = True
+
+        if changed:
+            _write_cache(entries, database_path)
+        if not pending:
+            return
+
+        total = len(pending)
+        done = 0
+        if progress is not None:
+            progress(done, total)
+        since_checkpoint = 0
+        for path, encoding in _iter_encoded(list(pending), max_workers or os.cpu_count() or 1, chunk_size):
+            name, digest, st = pending[path]
+            entries[name] = {"sha1": digest, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "encoding": encoding}
+            done += 1
+            since_checkpoint += 1
+            if since_checkpoint >= chunk_size or done == total:
+                _write_cache(entries, database_path)
+                since_checkpoint = 0
+            if progress is not None:
+                progress(done, total)
+
+# ---------------- Detectores de caras ----------------
+# Todos devuelven cajas (top, right, bottom, left) en coordenadas de la imagen recibida (la misma
+# que después se usa para el encoding), aunque internamente detecten sobre una copia a otra escala.
+DETECTOR_BACKENDS = ("hog", "haar", "dnn")
+HAAR_CASCADE = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+# Detector SSD ResNet-10 de OpenCV (no viene con opencv-python: bajar los dos archivos a ./models)
+DNN_PROTOTXT = "./models/deploy.prototxt"
+DNN_CAFFEMODEL = "./models/res10_300x300_ssd_iter_140000.caffemodel"
+
+class FaceDetector:
+    name = None
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self._local = threading.local()
+
+    def _model(self, build):
+        # Un modelo de OpenCV por hilo: Net / CascadeClassifier guardan estado por llamada (setInput,
+        # forward) y el mismo detector lo comparten todos los streams del pool de threads
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = self._local.model = build()
+        return model
+
+    def _detect(self, image):
+        # Cajas sobre la imagen ya escalada
+        raise NotImplementedError
+
+    def detect(self, image):
+        h, w = image.shape[:2]
+        small = image if self.scale == 1.0 else cv2.resize(image, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        boxes = []
+        for top, right, bottom, left in self._detect(small):
+            box = (max(0, int(round(top / self.scale))), min(w, int(round(right / self.scale))),
+                   min(h, int(round(bottom / self.scale))), max(0, int(round(left / self.scale))))
+            if box[1] > box[3] and box[2] > box[0]:
+                boxes.append(box)
+        return boxes
+
+    def __getstate__(self):
+        # Los objetos de OpenCV no se pueden picklear: se recrean en el proceso que los use
+        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def label(self):
+        return f"{self.name} scale={self.scale:g}"
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.__getstate__().items())})"
+
+class HogDetector(FaceDetector):
+    # El de siempre (dlib HOG); upsample > 1 encuentra caras más chicas a costa de tiempo
+    name = "hog"
+
+    def __init__(self, scale=1.0, upsample=1):
+        super().__init__(scale)
+        self.upsample = upsample
+
+    @property
+    def label(self):
+        return f"{super().label} upsample={self.upsample}"
+
+    def _detect(self, image):
+        return face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model="hog")
+
+class HaarDetector(FaceDetector):
+    name = "haar"
+
+    def __init__(self, scale=1.0, cascade_path=HAAR_CASCADE, scale_factor=1.1, min_neighbors=5, min_size=20):
+        super().__init__(scale)
+        self.cascade_path = cascade_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self._load()  # falla al crearlo y no en cada frame
+
+    def _load(self):
+        cascade = cv2.CascadeClassifier(self.cascade_path)
+        if cascade.empty():
+            raise FileNotFoundError(f"No se pudo cargar el cascade de Haar: {self.cascade_path}")
+        return cascade
+
+    def _detect(self, image):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = self._model(self._load).detectMultiScale(
+            gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size),
+        )
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in faces]
+
+class DnnDetector(FaceDetector):
+    name = "dnn"
+
+    def __init__(self, scale=1.0, prototxt=DNN_PROTOTXT, caffemodel=DNN_CAFFEMODEL, confidence=0.5, input_size=300):
+        super().__init__(scale)
+        self.prototxt = prototxt
+        self.caffemodel = caffemodel
+        self.confidence = confidence
+        self.input_size = input_size
+        for path in (prototxt, caffemodel):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Falta el modelo del detector DNN: {path}")
+
+    def _load(self):
+        return cv2.dnn.readNetFromCaffe(self.prototxt, self.caffemodel)
+
+    def _detect(self, image):
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (self.input_size, self.input_size), (104.0, 177.0, 123.0))
+        net = self._model(self._load)
+        net.setInput(blob)
+        detections = net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = detections[:, 3:7] * np.array([w, h, w, h])
+        return [(int(y0), int(x1), int(y1), int(x0)) for x0, y0, x1, y1 in boxes]
+
+_DETECTORS = {cls.name: cls for cls in (HogDetector, HaarDetector, DnnDetector)}
+
+def make_detector(backend="hog", **kwargs):
+    # FileNotFoundError si faltan los archivos del modelo (haar / dnn)
+    if backend not in _DETECTORS:
+        raise ValueError(f"Detector desconocido: {backend} (opciones: {', '.join(DETECTOR_BACKENDS)})")
+    return _DETECTORS[backend](**kwargs)
+
+def benchmark_detectors(database_path, detectors, limit=None, repeat=1):
+    # Corre cada detector sobre las fotos de la galería (una cara por foto) y devuelve por detector:
+    # {"detector", "images", "recall" (fotos con al menos una cara), "mean_ms", "p95_ms"}
+    paths = sorted(
+        os.path.join(database_path, f) for f in os.listdir(database_path)
+        if utils_files.is_valid_image(f)
+    )[:limit]
+    images = [cv2.imread(p) for p in paths]
+    images = [img for img in images if img is not None]
+    report = []
+    for detector in detectors:
+        found = 0
+        times = []
+        for img in images:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                boxes = detector.detect(img)
+                times.append(time.perf_counter() - start)
+            found += bool(boxes)
+        times_ms = np.asarray(times) * 1000
+        report.append({
+            "detector": detector.label,
+            "images": len(images),
+            "recall": found / len(images) if images else 0.0,
+            "mean_ms": float(times_ms.mean()) if len(times_ms) else 0.0,
+            "p95_ms": float(np.percentile(times_ms, 95)) if len(times_ms) else 0.0,
+        })
+    return report
+
+# get_face_location / get_face_encoding exigen una sola cara (alta de empleados);
+# get_face_locations / get_face_encodings devuelven todas (reconocimiento en vivo)
+def get_face_locations(image, detector=None):
+    # detector: FaceDetector (None = HOG de face_recognition, como siempre)
+    if image is None:
+        return []
+    if isinstance(image, str):
+        image = face_recognition.load_image_file(image)
+    if detector is not None:
+        return detector.detect(image)
+    return face_recognition.face_locations(image)
+
+def get_face_encodings(image, known_locations=None):
+    # Todas las caras en una sola llamada a face_encodings, en el orden de known_locations
+    if image is None:
+        return []
+    if isinstance(image, str):
+        image = face_recognition.load_image_file(image)
+    return face_recognition.face_encodings(image, known_face_locations=known_locations)
 
 def get_face_location(image):
     if image is None:
@@ -70,4 +410,284 @@ def _euclidean_distance(face1_encoding, face2_encoding):
 
 def comparison(face1_encoding, face2_encoding, tolerance=EUCLIDEAN_DISTANCE_TOLERANCE):
     euclidean_distance = _euclidean_distance(face1_encoding, face2_encoding)
-    return euclidean_distance, euclidean_distance <= tolerance
\ No newline at end of file
+    return euclidean_distance, euclidean_distance <= tolerance
+
+def _sq_euclidean(matrix, sq_norms, probe):
+    # d^2 = |m|^2 - 2 m.p + |p|^2, en una sola multiplicación matriz-vector
+    p = np.asarray(probe, dtype=np.float32).ravel()
+    sq = sq_norms - 2.0 * (matrix @ p) + float(p @ p)
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq, out=sq)
+
+def _sq_euclidean_batch(matrix, sq_norms, probes):
+    # Igual que _sq_euclidean para varias caras a la vez: (m, n), una multiplicación de matrices
+    p = np.asarray(probes, dtype=np.float32).reshape(-1, matrix.shape[1])
+    sq = sq_norms[None, :] - 2.0 * (p @ matrix.T) + np.einsum("ij,ij->i", p, p)[:, None]
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq, out=sq)
+
+class GalleryIndex:
+    # Todos los encodings válidos de la base en una sola matriz contigua (n, 128) float32,
+    # con un array paralelo de etiquetas (nombre de archivo). Una consulta = una operación vectorizada.
+    # Si se conocen los legajos (legajos[i] = -1 cuando la foto no está asociada a nadie),
+    # también permite decidir un único match por empleado con match_employees().
+    def __init__(self, encodings=None, labels=None, legajos=None):
+        if encodings is None or len(encodings) == 0:
+            self.matrix = np.empty((0, 128), dtype=np.float32)
+            self.labels = np.empty((0,), dtype=object)
+        else:
+            self.matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32))
+            self.labels = np.asarray(labels, dtype=object)
+        if len(self.labels) != len(self.matrix):
+            raise ValueError("encodings y labels deben tener la misma cantidad de filas")
+        if legajos is None:
+            legajos = [legajo_from_filename(str(lbl)) for lbl in self.labels]
+        self.legajos = np.asarray([-1 if leg is None else leg for leg in legajos], dtype=np.int64)
+        if len(self.legajos) != len(self.matrix):
+            raise ValueError("encodings y legajos deben tener la misma cantidad de filas")
+        # |m|^2 precalculado: d^2 = |m|^2 - 2 m.p + |p|^2
+        self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self._build_groups()
+
+    def _build_groups(self):
+        # Filas con legajo conocido, ordenadas por legajo para poder reducir por grupo con reduceat
+        known = np.flatnonzero(self.legajos >= 0)
+        order = known[np.argsort(self.legajos[known], kind="stable")]
+        self._group_order = order
+        if order.size == 0:
+            self.employees = np.empty((0,), dtype=np.int64)
+            self._group_starts = np.empty((0,), dtype=np.int64)
+            self._group_sizes = np.empty((0,), dtype=np.int64)
+            self._centroids = np.empty((0, 128), dtype=np.float32)
+            self._centroid_sq_norms = np.empty((0,), dtype=np.float32)
+            return
+        sorted_legs = self.legajos[order]
+        self.employees, self._group_starts, self._group_sizes = np.unique(
+            sorted_legs, return_index=True, return_counts=True
+        )
+        sums = np.add.reduceat(self.matrix[order], self._group_starts, axis=0)
+        self._centroids = np.ascontiguousarray(sums / self._group_sizes[:, None], dtype=np.float32)
+        self._centroid_sq_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+
+    @classmethod
+    def from_encodings(cls, encodings, resolve_legajo=legajo_from_filename):
+        # encodings: dict[archivo, vector | None] como lo devuelve get_saved_encodings
+        # resolve_legajo: archivo -> legajo | None (nombre numérico o tabla rostros)
+        labels = []
+        rows = []
+        legajos = []
+        for fname, enc in (encodings or {}).items():
+            if enc is None:
+                continue
+            labels.append(fname)
+            rows.append(enc)
+            legajos.append(resolve_legajo(fname) if resolve_legajo is not None else None)
+        return cls(rows, labels, legajos)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def distances(self, probe):
+        if len(self) == 0:
+            return np.empty((0,), dtype=np.float32)
+        return _sq_euclidean(self.matrix, self._sq_norms, probe)
+
+    def distances_batch(self, probes):
+        # (cantidad de caras, n)
+        if len(self) == 0:
+            return np.empty((len(probes), 0), dtype=np.float32)
+        return _sq_euclidean_batch(self.matrix, self._sq_norms, probes)
+
+    def match_employees(self, probe, tolerance=EUCLIDEAN_DISTANCE_TOLERANCE, strategy="min", min_votes=1):
+        # Una decisión por empleado: [(legajo, distancia)] ordenado por distancia.
+        # Con "vote" la distancia devuelta es la mínima entre sus fotos que votaron.
+        return self.match_employees_batch([probe], tolerance, strategy, min_votes)[0]
+
+    def match_employees_batch(self, probes, tolerance=EUCLIDEAN_DISTANCE_TOLERANCE, strategy="min", min_votes=1):
+        # match_employees para todas las caras de un frame en una sola operación: una lista por cara
+        if strategy not in MATCH_STRATEGIES:
+            raise ValueError(f"Estrategia desconocida: {strategy} (opciones: {', '.join(MATCH_STRATEGIES)})")
+        if len(probes) == 0:
+            return []
+        if self.employees.size == 0:
+            return [[] for _ in range(len(probes))]
+        if strategy == "centroid":
+            d = _sq_euclidean_batch(self._centroids, self._centroid_sq_norms, probes)
+            ok = d <= tolerance
+        else:
+            d_rows = self.distances_batch(probes)[:, self._group_order]
+            d = np.minimum.reduceat(d_rows, self._group_starts, axis=1)
+            if strategy == "vote":
+                votes = np.add.reduceat((d_rows <= tolerance).astype(np.int32), self._group_starts, axis=1)
+                # Un empleado con menos fotos que min_votes necesita que voten todas
+                ok = votes >= np.clip(min_votes, 1, self._group_sizes)
+            else:
+                ok = d <= tolerance
+        out = []
+        for row_d, row_ok in zip(d, ok):
+            idx = np.flatnonzero(row_ok)
+            idx = idx[np.argsort(row_d[idx], kind="stable")]
+            out.append([(int(self.employees[i]), float(row_d[i])) for i in idx])
+        return out
+
+    def search(self, probe, tolerance=EUCLIDEAN_DISTANCE_TOLERANCE, top_k=None):
+        # Devuelve [(label, distancia)] ordenado por distancia, sólo los que están dentro de la tolerancia
+        if top_k is not None and top_k < 1:
+            return []
+        d = self.distances(probe)
+        idx = np.flatnonzero(d <= tolerance)
+        if idx.size == 0:
+            return []
+        if top_k is not None and idx.size > top_k:
+            idx = idx[np.argpartition(d[idx], top_k - 1)[:top_k]]
+        idx = idx[np.argsort(d[idx], kind="stable")]
+        return [(self.labels[i], float(d[i])) for i in idx]
+
+
+# ---------------- Encodings en SQLite ----------------
+def _encoding_to_blob(encoding):
+    return np.asarray(encoding, dtype="<f4").tobytes()
+
+def _blob_to_encoding(blob):
+    return np.frombuffer(blob, dtype="<f4")
+
+def sync_encodings_to_db(database_path, db_path=utils_db.PYME_DB, modelo=ENCODING_MODEL):
+    # Lleva a rostros_encodings lo que cambió en el cache de la carpeta: (filas escritas, filas borradas)
+    entries, _ = _load_cache_entries(database_path)
+    valid = {f: e for f, e in entries.items() if e["encoding"] is not None and e["sha1"] is not None}
+    with utils_db.get_connection(db_path) as conn:
+        cur = conn.cursor()
+        utils_db.create_face_encodings_tables(cur)
+        in_db = utils_db.get_face_encoding_hashes(cur)
+        rows = [
+            (f, legajo_from_filename(f), e["sha1"], _encoding_to_blob(e["encoding"]))
+            for f, e in valid.items()
+            if in_db.get(f) != (modelo, e["sha1"])
+        ]
+        stale = [f for f in in_db if f not in valid]
+        if rows:
+            utils_db.upsert_face_encodings(cur, modelo, rows)
+        if stale:
+            utils_db.delete_face_encodings(cur, stale)
+    return len(rows), len(stale)
+
+# ---------------- Store compacto (memmap) ----------------
+# Copia de la galería al lado de la base para arrancar sin leer ni decodificar los blobs: matriz
+# float32 (n, 128) en .npy, que se abre con memmap (sin copiar; varios procesos comparten las mismas
+# páginas), + índice JSON con etiquetas, legajos y el estado (version, borrados) de rostros_encodings
+# del que salió. La matriz lleva un número de generación en el nombre porque en Windows no se puede
+# reemplazar un archivo mapeado por otro proceso.
+STORE_FORMAT = 1
+
+def get_store_index_path(db_path):
+    return f"{db_path}.encodings.json"
+
+def export_gallery_store(db_path, modelo, state, labels, legajos, matrix):
+    directory = os.path.dirname(os.path.abspath(db_path))
+    prefix = f"{os.path.basename(db_path)}.encodings."
+    matrix_name = f"{prefix}{time.time_ns()}.npy"
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    atomic_write(os.path.join(directory, matrix_name), lambda f: np.save(f, matrix, allow_pickle=False))
+    index = {
+        "format": STORE_FORMAT,
+        "modelo": modelo,
+        "state": list(state),
+        "matrix": matrix_name,
+        "rows": len(labels),
+        "labels": list(labels),
+        "legajos": list(legajos),
+    }
+    atomic_write(get_store_index_path(db_path), lambda f: json.dump(index, f), mode="w")
+    # Generaciones anteriores (si otro proceso todavía la tiene mapeada, queda para la próxima)
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(".npy") and name != matrix_name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+def load_gallery_store(db_path, modelo):
+    # (state, matriz memory-mapped de sólo lectura, labels, legajos), o None si no hay store o no sirve
+    try:
+        with open(get_store_index_path(db_path), mode="r") as f:
+            index = json.load(f)
+        if index.get("format") != STORE_FORMAT or index.get("modelo") != modelo:
+            return None
+        rows = index["rows"]
+        if rows == 0:
+            matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        else:
+            path = os.path.join(os.path.dirname(os.path.abspath(db_path)), index["matrix"])
+            matrix = np.load(path, mmap_mode="r", allow_pickle=False)
+        if matrix.shape != (rows, ENCODING_DIM) or matrix.dtype != np.float32 or len(index["labels"]) != rows:
+            return None
+        return tuple(index["state"]), matrix, index["labels"], index["legajos"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+class DbGallery:
+    # GalleryIndex alimentado desde rostros_encodings con una conexión propia de larga duración.
+    # refresh() no consulta nada si PRAGMA data_version no cambió (nadie más escribió la base);
+    # si cambió, lee sólo las filas con version posterior a la última vista. Un DELETE obliga a recargar todo.
+    # Con store=True arranca desde el store memmap (si lo hay) y lee de la base sólo lo posterior a él;
+    # cada vez que el índice cambia se vuelve a exportar.
+    def __init__(self, db_path=utils_db.PYME_DB, modelo=ENCODING_MODEL, store=True):
+        self.db_path = db_path
+        self.modelo = modelo
+        self.store = store
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        cur = self.conn.cursor()
+        utils_db.create_face_encodings_tables(cur)
+        self.conn.commit()
+        self._rows = {}  # archivo -> (legajo | None, vector)
+        self._data_version = None
+        self._version = 0
+        self._borrados = None
+        self.index = GalleryIndex()
+        if not (store and self._load_store()):
+            self.refresh(force=True)
+        else:
+            self.refresh()
+
+    def _load_store(self):
+        loaded = load_gallery_store(self.db_path, self.modelo)
+        if loaded is None:
+            return False
+        (self._version, self._borrados), matrix, labels, legajos = loaded
+        # Las filas son vistas sobre el memmap: no se copia nada hasta que algo cambie
+        self._rows = {f: (leg, matrix[i]) for i, (f, leg) in enumerate(zip(labels, legajos))}
+        self.index = GalleryIndex(matrix, labels, legajos)
+        return True
+
+    def refresh(self, force=False):
+        # True si el índice cambió
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA data_version")
+        data_version = cur.fetchone()[0]
+        if data_version == self._data_version and not force:
+            return False
+        self._data_version = data_version
+        version, borrados = utils_db.get_face_encodings_state(cur)
+        if force or borrados != self._borrados or version < self._version:  # < : base recreada
+            self._rows = {}
+            since = 0
+        elif version == self._version:
+            return False
+        else:
+            since = self._version
+        for archivo, legajo, blob in utils_db.get_face_encodings_since(cur, self.modelo, since):
+            self._rows[archivo] = (legajo, _blob_to_encoding(blob))
+        self._version, self._borrados = version, borrados
+        labels = sorted(self._rows)
+        matrix = np.asarray([self._rows[f][1] for f in labels], dtype=np.float32).reshape(-1, ENCODING_DIM)
+        legajos = [self._rows[f][0] for f in labels]
+        self.index = GalleryIndex(matrix, labels, legajos)
+        if self.store:
+            try:
+                export_gallery_store(self.db_path, self.modelo, (version, borrados), labels, legajos, matrix)
+            except OSError as e:
+                log.warning("No se pudo exportar el store de encodings: %s", e)
+        return True
+
+    def close(self):
+        self.conn.close()
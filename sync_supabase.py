@@ -1,16 +1,27 @@
 # sync_supabase.py
-# Ejecutar:  python sync_supabase.py
+# Ejecutar:  python sync_supabase.py            (sólo lo que cambió desde el último sync)
+#            python sync_supabase.py --full     (reenvía todo)
+#            python sync_supabase.py --dry-run  (lee los cambios y los "sube" a un destino en memoria)
+#            python sync_supabase.py --url http://localhost:8000   (PostgREST por HTTP, p.ej. un stub local)
 # Sincroniza empleados, rostros y asistencia_empleado desde SQLite local a Supabase vía HTTP.
+# Es incremental: triggers en SQLite anotan en sync_outbox cada fila insertada o modificada; acá se
+# vacía el outbox en orden, se sube el estado actual de esas filas y se borran las entradas confirmadas.
+# La subida (workers en paralelo, reintentos, lotes adaptativos) está en src/sync_uploader.py.
 # Requisitos: pip install supabase python-dotenv
 
+import argparse
+import json
 import os
+import urllib.parse
+import urllib.request
 import sys
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Protocol, Tuple
 
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 # --- asegurar import de src/ para reutilizar utils_db ---
 ROOT = Path(__file__).resolve().parent
@@ -18,40 +29,97 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
+from src import utils_db
 from src.utils_db import PYME_DB, get_connection  # usa tu DB local
+from src.sync_uploader import AdaptiveBatchSize, BatchUploader, TableStats, UploadJob
 
+BATCH_SIZE = 500  # tamaño inicial de los lotes de subida (después se adapta)
+OUTBOX_BATCH = 5000  # entradas del outbox que se leen por vuelta
 
-# ------------------ utilidades ------------------
-def rows_to_dicts(rows, cols) -> List[Dict[str, Any]]:
-    return [dict(zip(cols, r)) for r in rows]
+# Qué se lee de cada tabla, en orden de FKs: (columnas del SELECT, on_conflict, columnas de fecha)
+SYNC_SPECS = {
+    "empleados": ("legajo, nombre, puesto, COALESCE(area,'') AS area", "legajo", ()),
+    "rostros": ("archivo, legajo", "archivo", ()),
+    "asistencia_empleado": ("legajo_empleado, entrada, salida", "legajo_empleado,entrada", ("entrada", "salida")),
+}
+# Etapas de la subida: rostros y asistencias dependen sólo de empleados y van en paralelo
+SYNC_STAGES = (("empleados",), ("rostros", "asistencia_empleado"))
+# FKs: tabla -> {tabla padre: columna con la clave del padre}. Si un empleado no se pudo subir,
+# sólo se saltan sus rostros y asistencias; las del resto suben igual.
+SYNC_PARENTS = {
+    "empleados": {},
+    "rostros": {"empleados": "legajo"},
+    "asistencia_empleado": {"empleados": "legajo_empleado"},
+}
 
 
-def fetch_all(sql: str, params=()):
-    """Lee de SQLite usando tu helper get_connection."""
-    from sqlite3 import Row
-    results = []
-    cols = []
-    with get_connection(PYME_DB) as conn:
-        conn.row_factory = Row
-        cur = conn.cursor()
-        cur.execute(sql, params)
-        data = cur.fetchall()
-        if data:
-            cols = [d[0] for d in cur.description]
-            results = [tuple(r) for r in data]
-    return results, cols
+# ------------------ destinos ------------------
+class SyncTarget(Protocol):
+    # upsert debe lanzar una excepción si el servidor no confirmó el lote
+    def upsert(self, table: str, rows: List[Dict[str, Any]], on_conflict: str) -> None: ...
+
+
+class SupabaseTarget:
+    def __init__(self, client):
+        self.client = client
+
+    def upsert(self, table, rows, on_conflict):
+        self.client.table(table).upsert(rows, on_conflict=on_conflict).execute()
+
+
+class HttpTarget:
+    # PostgREST por HTTP sin dependencias (lo mismo que expone Supabase en /rest/v1); sirve también
+    # para probar contra un servidor stub local. urlopen lanza HTTPError con cualquier status >= 400.
+    def __init__(self, url, key=None, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.key = key
+        self.timeout = timeout
+
+    def upsert(self, table, rows, on_conflict):
+        headers = {"Content-Type": "application/json", "Prefer": "resolution=merge-duplicates,return=minimal"}
+        if self.key:
+            headers.update({"apikey": self.key, "Authorization": f"Bearer {self.key}"})
+        req = urllib.request.Request(
+            f"{self.url}/rest/v1/{table}?on_conflict={urllib.parse.quote(on_conflict)}",
+            data=json.dumps(rows, default=str).encode("utf-8"), headers=headers, method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
 
 
-def make_supabase() -> Client:
+class MemoryTarget:
+    # Destino falso en memoria (pruebas locales / --dry-run): upsert por las columnas de on_conflict
+    def __init__(self):
+        self.tables: Dict[str, Dict[Tuple, Dict[str, Any]]] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, table, rows, on_conflict):
+        keys = [k.strip() for k in on_conflict.split(",")]
+        with self._lock:
+            self.calls += 1
+            stored = self.tables.setdefault(table, {})
+            for row in rows:
+                stored[tuple(row[k] for k in keys)] = dict(row)
+
+
+# ------------------ utilidades ------------------
+def supabase_key():
     load_dotenv()  # lee .env en raíz
     # Acepta variables con o sin prefijo REACT_APP_
-    url = os.getenv("SUPABASE_URL") or os.getenv("REACT_APP_SUPABASE_URL")
-    key = (
+    return (
         os.getenv("SUPABASE_SERVICE_KEY")
         or os.getenv("SUPABASE_KEY")
         or os.getenv("REACT_APP_SUPABASE_ANON_KEY")
         or os.getenv("SUPABASE_ANON_KEY")
     )
+
+
+def make_supabase():
+    from supabase import create_client
+
+    key = supabase_key()
+    url = os.getenv("SUPABASE_URL") or os.getenv("REACT_APP_SUPABASE_URL")
     if not url or not key:
         raise RuntimeError(
             "Faltan credenciales. Definí SUPABASE_URL y SUPABASE_SERVICE_KEY (o ANON_KEY) en el .env"
@@ -61,48 +129,10 @@ def make_supabase() -> Client:
 
 
 def chunked(iterable, size):
-    """Genera bloques de tamaño 'size' para evitar rate limits."""
-    for i in range(0, len(iterable)):
-        if i % size == 0:
-            yield iterable[i : i + size]
-
-
-# ------------------ sincronizaciones ------------------
-def sync_empleados(supabase: Client):
-    rows, cols = fetch_all(
-        "SELECT legajo, nombre, puesto, COALESCE(area,'') AS area FROM empleados ORDER BY legajo ASC"
-    )
-    if not rows:
-        print("empleados: no hay filas para enviar.")
-        return 0, 0
-
-    data = rows_to_dicts(rows, cols)
-    print(f"empleados: enviando {len(data)} filas…")
-    inserted = 0
-    for batch in chunked(data, 500):
-        resp = supabase.table("empleados").upsert(
-            batch, on_conflict="legajo"
-        ).execute()
-        # La API no devuelve counts exactos; asumimos éxito si no hay error
-        inserted += len(batch)
-    print("empleados: OK")
-    return inserted, 0
-
-
-def sync_rostros(supabase: Client):
-    rows, cols = fetch_all("SELECT archivo, legajo FROM rostros ORDER BY archivo ASC")
-    if not rows:
-        print("rostros: no hay filas para enviar.")
-        return 0, 0
-
-    data = rows_to_dicts(rows, cols)
-    print(f"rostros: enviando {len(data)} filas…")
-    inserted = 0
-    for batch in chunked(data, 500):
-        supabase.table("rostros").upsert(batch, on_conflict="archivo").execute()
-        inserted += len(batch)
-    print("rostros: OK")
-    return inserted, 0
+    """Genera listas de hasta 'size' elementos de cualquier iterable (también generadores)."""
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
 
 
 def _normalize_ts(value):
@@ -130,45 +160,173 @@ def _normalize_ts(value):
     return str(value)
 
 
-def sync_asistencias(supabase: Client):
-    rows, cols = fetch_all(
-        "SELECT legajo_empleado, entrada, salida FROM asistencia_empleado ORDER BY legajo_empleado, entrada ASC"
-    )
-    if not rows:
-        print("asistencia_empleado: no hay filas para enviar.")
-        return 0, 0
-
-    dicts = []
-    for r in rows:
-        d = dict(zip(cols, r))
-        d['entrada'] = _normalize_ts(d.get('entrada'))
-        d['salida'] = _normalize_ts(d.get('salida'))
-        dicts.append(d)
-
-    print(f"asistencia_empleado: enviando {len(dicts)} filas…")
-    inserted = 0
-    for batch in chunked(dicts, 500):
-        supabase.table("asistencia_empleado").upsert(
-            batch, on_conflict="legajo_empleado,entrada"
-        ).execute()
-        inserted += len(batch)
-    print("asistencia_empleado: OK")
-    return inserted, 0
-
-
-def main():
-    print("Conectando a Supabase…")
-    sb = make_supabase()
-
-    # Respeta FKs: empleados -> rostros/asistencias
-    e_ins, _ = sync_empleados(sb)
-    r_ins, _ = sync_rostros(sb)
-    a_ins, _ = sync_asistencias(sb)
+def upload_items(rows, fechas):
+    # sqlite3.Row -> (clave, fila) con las fechas normalizadas sobre el mismo dict, de a una fila
+    for row in rows:
+        d = dict(row)
+        clave = d.pop("_clave")
+        for col in fechas:
+            d[col] = _normalize_ts(d[col])
+        yield clave, d
+
+
+def _merge(totals, stats):
+    for table, st in stats.items():
+        total = totals[table]
+        total.sent += st.sent
+        total.failed += st.failed
+        total.skipped += st.skipped
+        total.batches += st.batches
+        total.retries += st.retries
+
+
+# ------------------ sincronización ------------------
+def sync_outbox(conn, uploader: BatchUploader, batch_size=OUTBOX_BATCH, advance=True):
+    # Vacía el outbox de a batch_size entradas, en orden de id. Cada vuelta lee el estado actual de
+    # las filas anotadas, las sube por etapas (SYNC_STAGES) y borra las entradas de las filas que el
+    # servidor confirmó (commit por vuelta). Lo que no se pudo subir queda en el outbox para el
+    # próximo sync y no frena al resto: las vueltas siguientes saltan sólo las filas que dependen de
+    # ello. Si una vuelta no pudo subir nada (servidor caído) se corta. Con advance=False no se borra nada.
+    cur = conn.cursor()
+    totals = {table: TableStats() for table in SYNC_SPECS}
+    missing = {}  # tabla -> claves que no se subieron en este sync
+    last_id = 0
+    while True:
+        entries = utils_db.get_outbox_batch(cur, last_id, batch_size)
+        if not entries:
+            break
+        last_id = entries[-1][0]
+        pending = {}  # tabla -> {clave: [ids del outbox]}
+        for entry_id, table, clave in entries:
+            pending.setdefault(table, {}).setdefault(clave, []).append(entry_id)
+        done = []  # ids a borrar: filas confirmadas o que ya no existen
+        stages = []
+        for stage in SYNC_STAGES:
+            jobs = []
+            for table in stage:
+                if table not in pending:
+                    continue
+                columnas, on_conflict, fechas = SYNC_SPECS[table]
+                items = list(upload_items(utils_db.iter_rows_by_key(conn, table, columnas, pending[table]), fechas))
+                found = {clave for clave, _ in items}
+                done += [i for clave, ids in pending[table].items() if clave not in found for i in ids]
+                jobs.append(UploadJob(table, on_conflict, items, SYNC_PARENTS[table]))
+            stages.append(jobs)
+
+        stats = uploader.upload(stages, missing)
+        _merge(totals, stats)
+        for table, st in stats.items():
+            done += [i for clave in st.acked for i in pending[table][clave]]
+        if advance:
+            utils_db.delete_outbox_entries(cur, done)
+            utils_db.update_sync_watermarks(cur)
+            conn.commit()
+        if any(st.failed for st in stats.values()) and not any(st.acked for st in stats.values()):
+            break
+    return totals
+
+
+def sync_full(conn, uploader: BatchUploader, page=OUTBOX_BATCH, advance=True):
+    # Reenvía todas las filas leyendo cada tabla en streaming (keyset + fetchmany, ver
+    # utils_db.iter_table_rows) y armando los lotes al vuelo: la memoria no depende del tamaño de la
+    # tabla. Cada vuelta sube una página de cada tabla de la etapa. Las entradas del outbox anteriores
+    # al arranque quedan cubiertas y se borran si todo se subió; lo que cambie mientras tanto entra al
+    # outbox con id posterior y sale en el drenado siguiente. Las filas que dependen de algo que no
+    # se subió se saltan (ver SYNC_PARENTS).
+    cur = conn.cursor()
+    hasta = utils_db.get_outbox_max_id(cur)
+    totals = {table: TableStats() for table in SYNC_SPECS}
+    missing = {}
+    for stage in SYNC_STAGES:
+        batches = {}
+        for table in stage:
+            columnas, _, fechas = SYNC_SPECS[table]
+            rows = utils_db.iter_table_rows(conn, table, columnas, page)
+            batches[table] = chunked(upload_items(rows, fechas), page)
+        while batches:
+            jobs = []
+            for table, it in list(batches.items()):
+                items = next(it, None)
+                if items is None:
+                    del batches[table]
+                    continue
+                jobs.append(UploadJob(table, SYNC_SPECS[table][1], items, SYNC_PARENTS[table]))
+            if not jobs:
+                break
+            stats = uploader.upload([jobs], missing)
+            _merge(totals, stats)
+            if any(st.failed for st in stats.values()) and not any(st.acked for st in stats.values()):
+                return totals  # no subió nada: servidor caído
+    if advance and not any(st.failed or st.skipped for st in totals.values()):
+        utils_db.delete_outbox_through(cur, hasta)
+        utils_db.update_sync_watermarks(cur)
+        conn.commit()
+    return totals
+
+
+def sync_all(target: SyncTarget, db_path=PYME_DB, batch_size=BATCH_SIZE, full=False, advance=True,
+             workers=4, retries=4):
+    # {tabla: TableStats}; respeta FKs: empleados -> rostros/asistencias
+    uploader = BatchUploader(target, workers=workers, retries=retries, batch_size=AdaptiveBatchSize(batch_size))
+    with get_connection(db_path) as conn:
+        cur = conn.cursor()
+        utils_db.create_sync_tables(cur)
+        conn.commit()
+        if full:
+            totals = sync_full(conn, uploader, advance=advance)
+            # Cambios que entraron al outbox durante el sync completo (con --dry-run ya están incluidos)
+            if advance and not any(st.failed for st in totals.values()):
+                _merge(totals, sync_outbox(conn, uploader))
+        else:
+            totals = sync_outbox(conn, uploader, advance=advance)
+        for table, st in totals.items():
+            if not (st.sent or st.failed or st.skipped):
+                print(f"{table}: sin cambios.")
+                continue
+            detalle = [f"{st.sent} filas enviadas en {st.batches} lotes"]
+            if st.retries:
+                detalle.append(f"{st.retries} reintentos")
+            if st.failed:
+                detalle.append(f"{st.failed} fallidas")
+            if st.skipped:
+                detalle.append(f"{st.skipped} pendientes por FKs")
+            print(f"{table}: " + ", ".join(detalle))
+        print(f"Pendientes en el outbox: {utils_db.count_outbox(cur)}")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sincroniza la base local con Supabase")
+    parser.add_argument("--db", default=PYME_DB, help="Ruta a la base SQLite")
+    parser.add_argument("--full", action="store_true", help="Reenviar todas las filas, no sólo los cambios")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="No conectarse: enviar a un destino en memoria sin vaciar el outbox")
+    parser.add_argument("--url", default=None,
+                        help="Subir por HTTP a esta URL de PostgREST (p.ej. un stub local) en vez del cliente supabase")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tamaño inicial de los lotes")
+    parser.add_argument("--workers", type=int, default=4, help="Lotes en vuelo a la vez")
+    parser.add_argument("--retries", type=int, default=4, help="Reintentos por lote antes de darlo por fallido")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        target = MemoryTarget()
+    elif args.url:
+        target = HttpTarget(args.url, supabase_key())
+    else:
+        print("Conectando a Supabase…")
+        target = SupabaseTarget(make_supabase())
+
+    totals = sync_all(target, args.db, args.batch_size, full=args.full, advance=not args.dry_run,
+                      workers=args.workers, retries=args.retries)
 
     print("—" * 50)
-    print(f"Totales enviados: empleados={e_ins}, rostros={r_ins}, asistencias={a_ins}")
+    print("Totales enviados: " + ", ".join(f"{t}={st.sent}" for t, st in totals.items()))
+    if any(st.failed or st.skipped for st in totals.values()):
+        print("Sincronización incompleta ⚠️")
+        return 1
     print("Sincronización finalizada ✅")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
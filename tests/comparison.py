@@ -8,13 +8,10 @@ db_images = PYME_EMPLOYEES_IMAGES
 u_rec._save_encodings_if_necessary(db_images)
 database_encodings = u_rec.get_saved_encodings(db_images)
 
-main_img_encoding = u_rec.get_face_encoding(main_img)
-matches = []
+gallery = u_rec.GalleryIndex.from_encodings(database_encodings)
 
-for file_name, person_encoding in database_encodings.items():
-    d, are_the_same_person = u_rec.comparison(main_img_encoding, person_encoding)
-    if are_the_same_person:
-        matches.append((os.path.join(db_images, file_name), d))
+main_img_encoding = u_rec.get_face_encoding(main_img)
+matches = [(os.path.join(db_images, file_name), d) for file_name, d in gallery.search(main_img_encoding)]
 
 if matches:
     print("Matches found with {}: ".format(main_img))
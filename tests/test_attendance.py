@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+from src import utils_db
+
+T0 = datetime(2026, 1, 5, 8, 0, 0).timestamp()
+
+
+class TestEmpleadoDetected(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pyme.db")
+        utils_db.ensure_db_seeded(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.cur = self.conn.cursor()
+        self.shifts = utils_db.OpenShifts()
+        self.shifts.reload(self.cur)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def rows(self, legajo):
+        return self.cur.execute("SELECT entrada, salida FROM asistencia_empleado WHERE legajo_empleado = ?"
+                                " ORDER BY entrada", (legajo,)).fetchall()
+
+    def test_alternates_entrada_and_salida(self):
+        self.assertEqual(utils_db.empleado_detected(self.cur, 1, T0, self.shifts), "entrada")
+        self.assertEqual(self.shifts.get(1), "2026-01-05 08:00:00")
+        self.assertEqual(utils_db.empleado_detected(self.cur, 1, T0 + 3600, self.shifts), "salida")
+        self.assertIsNone(self.shifts.get(1))
+        self.assertEqual(self.rows(1), [("2026-01-05 08:00:00", "2026-01-05 09:00:00")])
+
+    def test_ignores_events_that_do_not_match_the_open_shift(self):
+        self.assertIsNone(utils_db.empleado_detected(self.cur, 2, T0, self.shifts, evento="salida"))
+        self.assertEqual(utils_db.empleado_detected(self.cur, 2, T0, self.shifts, evento="entrada"), "entrada")
+        self.assertIsNone(utils_db.empleado_detected(self.cur, 2, T0 + 60, self.shifts, evento="entrada"))
+        self.assertEqual(utils_db.empleado_detected(self.cur, 2, T0 + 120, self.shifts, evento="salida"), "salida")
+        self.assertEqual(self.rows(2), [("2026-01-05 08:00:00", "2026-01-05 08:02:00")])
+
+    def test_same_result_with_and_without_shifts(self):
+        self.assertEqual(utils_db.empleado_detected(self.cur, 3, T0), "entrada")
+        self.shifts.reload(self.cur)
+        self.assertEqual(self.shifts.get(3), "2026-01-05 08:00:00")
+        self.assertEqual(len(self.shifts), 1)
+        self.assertEqual(utils_db.empleado_detected(self.cur, 3, T0 + 60, self.shifts), "salida")
+        self.assertEqual(utils_db.empleado_detected(self.cur, 3, T0 + 120), "entrada")
+
+    def test_sync_picks_up_writes_from_another_connection(self):
+        self.conn.commit()
+        self.shifts.sync(self.cur)
+        with utils_db.get_connection(self.db_path) as other:
+            utils_db.empleado_detected(other.cursor(), 4, T0)
+        self.assertIsNone(self.shifts.get(4))
+        self.shifts.sync(self.cur)
+        self.assertEqual(self.shifts.get(4), "2026-01-05 08:00:00")
+        self.assertEqual(utils_db.empleado_detected(self.cur, 4, T0 + 60, self.shifts, evento="salida"), "salida")
+
+    def test_reload_after_rollback(self):
+        self.conn.commit()
+        utils_db.empleado_detected(self.cur, 5, T0, self.shifts)
+        self.conn.rollback()
+        self.assertIsNotNone(self.shifts.get(5))  # quedó lo que no se confirmó
+        self.shifts.reload(self.cur)
+        self.assertIsNone(self.shifts.get(5))
+        self.assertEqual(utils_db.empleado_detected(self.cur, 5, T0 + 60, self.shifts), "entrada")
+
+
+if __name__ == "__main__":
+    unittest.main()
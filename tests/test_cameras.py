@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from src import recognition_pipeline as rp
+from src.cameras import CameraManager, is_video_file, parse_source
+from src.utils_recognition import GalleryIndex
+
+FPS = 10
+
+
+def write_video(path, brightness):
+    # Un frame por valor de brillo; los frames claros hacen de "hay una cara" para el detector falso
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (64, 48))
+    for value in brightness:
+        writer.write(np.full((48, 64, 3), value, dtype=np.uint8))
+    writer.release()
+
+
+def fake_detect(small, detector=None):
+    return [(2, 10, 10, 2)] if small.mean() > 100 else []
+
+
+def fake_encode(small, boxes):
+    v = np.zeros(128, dtype=np.float32)
+    v[1] = 1.0
+    return [v for _ in boxes]
+
+
+class TestSources(unittest.TestCase):
+    def test_parse_source(self):
+        self.assertEqual(parse_source("0"), 0)
+        self.assertEqual(parse_source(" 2 "), 2)
+        self.assertEqual(parse_source(1), 1)
+        self.assertEqual(parse_source("rtsp://10.0.0.5/stream1"), "rtsp://10.0.0.5/stream1")
+
+    def test_is_video_file(self):
+        self.assertTrue(is_video_file("puerta_norte.avi"))
+        self.assertFalse(is_video_file("0"))
+        self.assertFalse(is_video_file("rtsp://10.0.0.5/stream1"))
+
+
+class VideoFileTestCase(unittest.TestCase):
+    # Un archivo de video local hace de cámara: 1 s con alguien en cuadro y 1 s vacío, a 10 fps
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.video = os.path.join(self.tmp.name, "puerta.avi")
+        write_video(self.video, [200] * 10 + [20] * 10)
+
+
+class TestFrameGrabberOnVideoFile(VideoFileTestCase):
+    def grab(self, **kwargs):
+        slot = rp.LatestFrameSlot()
+        grabber = rp.FrameGrabber(cv2.VideoCapture(self.video), slot, video_file=True, **kwargs)
+        items = []
+        started = time.monotonic()
+        grabber.start()
+        while True:
+            item = slot.get(timeout=5)
+            if item is None:
+                break
+            items.append(item)
+        grabber.join(5)
+        grabber.release_when_done()
+        return grabber, items, time.monotonic() - started
+
+    def test_every_frame_keeps_all_frames_with_video_time(self):
+        grabber, items, _ = self.grab(every_frame=True)
+        self.assertTrue(grabber.ended)
+        self.assertEqual([frame_id for frame_id, _, _ in items], list(range(1, 21)))
+        times = np.array([t for _, t, _ in items])
+        np.testing.assert_allclose(np.diff(times), 1.0 / FPS, atol=1e-6)
+        self.assertAlmostEqual(grabber.clock, times[-1])
+
+    def test_plays_at_video_speed(self):
+        grabber, _, elapsed = self.grab()
+        self.assertEqual(grabber.frames, 20)
+        self.assertGreaterEqual(elapsed, 19 / FPS - 0.05)
+
+
+class TestCameraManagerOnVideoFiles(VideoFileTestCase):
+    def setUp(self):
+        super().setUp()
+        patches = [
+            mock.patch.object(rp, "detect_faces", side_effect=fake_detect),
+            mock.patch.object(rp, "encode_faces", side_effect=fake_encode),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+        self.events = []
+
+    def test_two_doors_share_the_pool_with_their_own_presence(self):
+        other = os.path.join(self.tmp.name, "porton.avi")
+        write_video(other, [20] * 20)  # nadie pasa por esta puerta
+        gallery = GalleryIndex([fake_encode(None, [None])[0]], ["1.jpg"], [1])
+        manager = CameraManager(
+            {"puerta": self.video, "porton": other}, gallery,
+            on_event=lambda stream, evento, legajo, t: self.events.append((stream, evento, legajo, t)),
+            pool=self.pool, tracker=None, motion=None, every_frame=True,
+            disappear_seconds=0.5, cooldown_seconds=0,
+        )
+        stop = threading.Event()
+        guard = threading.Timer(20, stop.set)  # por si un stream no termina
+        guard.start()
+        try:
+            manager.run_headless(stop_event=stop, poll_interval=0.01)
+        finally:
+            guard.cancel()
+        self.assertFalse(stop.is_set())
+        self.assertEqual([e[:3] for e in self.events], [("puerta", "entrada", 1), ("puerta", "salida", 1)])
+        # Tiempo del video: visto en los frames 0 a 9
+        self.assertAlmostEqual(self.events[1][3] - self.events[0][3], 0.9, places=3)
+        for st in manager.stats():
+            self.assertEqual((st.frames_captured, st.frames_processed, st.frames_dropped), (20, 20, 0))
+        self.assertEqual({st.name: st.faces_seen for st in manager.stats()}, {"puerta": 10, "porton": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import utils_db
+from src import utils_recognition as u_rec
+
+
+def vec(i):
+    v = np.zeros(128, dtype=np.float32)
+    v[i] = 1.0
+    return v
+
+
+class DbGalleryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pyme.db")
+        utils_db.ensure_db_seeded(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        utils_db.create_face_encodings_tables(self.conn.cursor())
+        self.put(("1.jpg", 1, 1), ("2.jpg", 2, 2), ("foto.jpg", None, 3))
+        self.galleries = []
+
+    def tearDown(self):
+        for gallery in self.galleries:
+            gallery.close()
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def put(self, *rows):
+        # rows: (archivo, legajo, eje del vector)
+        utils_db.upsert_face_encodings(self.conn.cursor(), u_rec.ENCODING_MODEL, [
+            (archivo, legajo, f"sha-{eje}", u_rec._encoding_to_blob(vec(eje))) for archivo, legajo, eje in rows
+        ])
+        self.conn.commit()
+
+    def gallery(self, **kwargs):
+        gallery = u_rec.DbGallery(self.db_path, **kwargs)
+        self.galleries.append(gallery)
+        return gallery
+
+    def employees(self, gallery):
+        return dict(zip(gallery.index.labels.tolist(), gallery.index.legajos.tolist()))
+
+
+class TestDbGalleryRefresh(DbGalleryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = self.gallery(store=False)
+
+    def test_nothing_changed(self):
+        self.assertFalse(self.db.refresh())
+        self.assertEqual(self.employees(self.db), {"1.jpg": 1, "2.jpg": 2, "foto.jpg": -1})
+
+    def test_incremental_update_reads_only_new_rows(self):
+        version, _ = utils_db.get_face_encodings_state(self.conn.cursor())
+        self.put(("3.jpg", 3, 4), ("2.jpg", 2, 5))
+        with mock.patch.object(utils_db, "get_face_encodings_since", wraps=utils_db.get_face_encodings_since) as read:
+            self.assertTrue(self.db.refresh())
+        self.assertEqual(read.call_args[0][2], version)
+        self.assertEqual(self.employees(self.db), {"1.jpg": 1, "2.jpg": 2, "3.jpg": 3, "foto.jpg": -1})
+        self.assertEqual(self.db.index.match_employees(vec(5), tolerance=0.1)[0][0], 2)
+        self.assertEqual(self.db.index.match_employees(vec(2), tolerance=0.1), [])
+
+    def test_mapping_change_updates_the_legajo(self):
+        utils_db.add_face_mapping(self.conn.cursor(), "foto.jpg", 5)
+        self.conn.commit()
+        self.assertTrue(self.db.refresh())
+        self.assertEqual(self.employees(self.db)["foto.jpg"], 5)
+        self.assertEqual(self.db.index.match_employees(vec(3), tolerance=0.1)[0][0], 5)
+
+    def test_delete_reloads_everything(self):
+        utils_db.delete_face_encodings(self.conn.cursor(), ["2.jpg"])
+        self.conn.commit()
+        with mock.patch.object(utils_db, "get_face_encodings_since", wraps=utils_db.get_face_encodings_since) as read:
+            self.assertTrue(self.db.refresh())
+        self.assertEqual(read.call_args[0][2], 0)
+        self.assertEqual(self.employees(self.db), {"1.jpg": 1, "foto.jpg": -1})
+
+
+class TestGalleryStore(DbGalleryTestCase):
+    def test_second_process_starts_from_the_store(self):
+        first = self.gallery()
+        self.assertTrue(os.path.exists(u_rec.get_store_index_path(self.db_path)))
+        with mock.patch.object(utils_db, "get_face_encodings_since", wraps=utils_db.get_face_encodings_since) as read:
+            second = self.gallery()
+        read.assert_not_called()
+        self.assertIsInstance(second.index.matrix.base, np.memmap)
+        self.assertEqual(self.employees(second), self.employees(first))
+        np.testing.assert_array_equal(second.index.matrix, first.index.matrix)
+
+    def test_only_rows_newer_than_the_store_are_read(self):
+        self.gallery()
+        version, _ = utils_db.get_face_encodings_state(self.conn.cursor())
+        self.put(("3.jpg", 3, 4))
+        with mock.patch.object(utils_db, "get_face_encodings_since", wraps=utils_db.get_face_encodings_since) as read:
+            gallery = self.gallery()
+        self.assertEqual(read.call_args[0][2], version)
+        self.assertEqual(self.employees(gallery), {"1.jpg": 1, "2.jpg": 2, "3.jpg": 3, "foto.jpg": -1})
+        # El store quedó al día y sólo queda la última generación de la matriz
+        matrices = [f for f in os.listdir(self.tmp.name) if f.startswith("pyme.db.encodings.") and f.endswith(".npy")]
+        self.assertEqual(len(matrices), 1)
+        self.assertEqual(len(u_rec.load_gallery_store(self.db_path, u_rec.ENCODING_MODEL)[2]), 4)
+
+    def test_unusable_store_falls_back_to_the_database(self):
+        self.gallery()
+        with open(u_rec.get_store_index_path(self.db_path), "w") as f:
+            f.write("{roto")
+        self.assertIsNone(u_rec.load_gallery_store(self.db_path, u_rec.ENCODING_MODEL))
+        self.assertEqual(len(self.gallery().index), 3)
+        self.assertIsNone(u_rec.load_gallery_store(self.db_path, "otro-modelo"))
+
+    def test_store_can_be_disabled(self):
+        gallery = self.gallery(store=False)
+        self.assertEqual(len(gallery.index), 3)
+        self.assertFalse(os.path.exists(u_rec.get_store_index_path(self.db_path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
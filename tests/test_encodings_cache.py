@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import utils_recognition as u_rec
+
+
+class FakeEncoder:
+    # Encoding = primer byte del archivo en el eje 0; "corrupta" no se puede abrir
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(os.path.basename(path))
+        with open(path, "rb") as f:
+            data = f.read()
+        if data == b"corrupta":
+            raise OSError(f"cannot identify image file {path!r}")
+        v = np.zeros(128)
+        v[0] = data[0]
+        return v
+
+
+class EncodingsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.encoder = FakeEncoder()
+        patcher = mock.patch.object(u_rec, "get_face_encoding", self.encoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.dir, name), "wb") as f:
+            f.write(data)
+
+    def update(self):
+        del self.encoder.calls[:]
+        u_rec._save_encodings_if_necessary(self.dir, max_workers=1)
+        return u_rec.get_saved_encodings(self.dir)
+
+
+class TestIncrementalCache(EncodingsCacheTestCase):
+    def test_only_new_content_is_encoded(self):
+        self.write("1.jpg", b"\x01")
+        self.write("2.jpg", b"\x02")
+        self.update()
+        self.assertEqual(sorted(self.encoder.calls), ["1.jpg", "2.jpg"])
+        # Copia con otro nombre: el encoding sale del hash, sin volver a calcularlo
+        self.write("3.jpg", b"\x02")
+        saved = self.update()
+        self.assertEqual(self.encoder.calls, [])
+        self.assertEqual(saved["3.jpg"][0], 2)
+
+    def test_replaced_photo_is_reencoded(self):
+        self.write("1.jpg", b"\x01")
+        self.update()
+        self.write("1.jpg", b"\x07\x07")  # mismo nombre, otro contenido
+        saved = self.update()
+        self.assertEqual(self.encoder.calls, ["1.jpg"])
+        self.assertEqual(saved["1.jpg"][0], 7)
+
+    def test_touched_photo_keeps_its_encoding(self):
+        self.write("1.jpg", b"\x01")
+        self.update()
+        path = os.path.join(self.dir, "1.jpg")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.update()
+        self.assertEqual(self.encoder.calls, [])
+
+    def test_deleted_photos_are_evicted(self):
+        self.write("1.jpg", b"\x01")
+        self.write("2.jpg", b"\x02")
+        self.update()
+        os.remove(os.path.join(self.dir, "2.jpg"))
+        self.assertEqual(set(self.update()), {"1.jpg"})
+
+    def test_nothing_changed_does_not_rewrite_the_cache(self):
+        self.write("1.jpg", b"\x01")
+        self.write("notas.txt", b"no es una imagen")
+        self.update()
+        with mock.patch.object(u_rec, "_write_cache", wraps=u_rec._write_cache) as write:
+            saved = self.update()
+        write.assert_not_called()
+        self.assertEqual(set(saved), {"1.jpg"})
+
+    def test_cache_is_written_atomically(self):
+        self.write("1.jpg", b"\x01")
+        self.update()
+        # Sin temporales olvidados al lado del cache
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(["1.jpg", u_rec.ENCODINGS_FILE]))
+
+
+class TestBadImages(EncodingsCacheTestCase):
+    def test_unreadable_image_is_stored_without_encoding(self):
+        self.write("1.jpg", b"\x01")
+        self.write("2.jpg", b"corrupta")
+        self.write("3.jpg", b"\x03")
+        with self.assertLogs("utils_recognition", "WARNING"):
+            saved = self.update()
+        self.assertIsNone(saved["2.jpg"])
+        self.assertEqual((saved["1.jpg"][0], saved["3.jpg"][0]), (1, 3))
+        # No se vuelve a intentar mientras el archivo no cambie
+        self.update()
+        self.assertEqual(self.encoder.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from src.utils_recognition import GalleryIndex
+
+
+def vec(axis=None, scale=0.0):
+    v = np.zeros(128, dtype=np.float32)
+    if axis is not None:
+        v[axis] = scale
+    return v
+
+
+class TestMatchEmployeesBatch(unittest.TestCase):
+    def setUp(self):
+        # Legajo 10: dos fotos a distancia 1 entre sí; legajo 20: una sola foto; una foto sin legajo
+        self.gallery = GalleryIndex(
+            [vec(), vec(0, 1.0), vec(1, 0.5), vec(2, 0.05)],
+            ["10_a.jpg", "10_b.jpg", "20.jpg", "sin_legajo.jpg"],
+            [10, 10, 20, None],
+        )
+        self.probe = vec(0, 0.1)
+
+    def assertMatches(self, got, expected):
+        self.assertEqual([leg for leg, _ in got], [leg for leg, _ in expected])
+        for (_, d), (_, e) in zip(got, expected):
+            self.assertAlmostEqual(d, e, places=4)
+
+    def test_min_uses_the_closest_photo(self):
+        got = self.gallery.match_employees_batch([self.probe], tolerance=0.6, strategy="min")
+        self.assertMatches(got[0], [(10, 0.1), (20, np.hypot(0.1, 0.5))])
+
+    def test_centroid_uses_the_mean_of_the_photos(self):
+        got = self.gallery.match_employees_batch([self.probe], tolerance=0.6, strategy="centroid")
+        self.assertMatches(got[0], [(10, 0.4), (20, np.hypot(0.1, 0.5))])
+
+    def test_vote_needs_min_votes_photos_within_tolerance(self):
+        got = self.gallery.match_employees_batch([self.probe], tolerance=0.6, strategy="vote", min_votes=2)
+        # 10 tiene un solo voto de dos; 20 tiene una sola foto y con ese voto alcanza
+        self.assertMatches(got[0], [(20, np.hypot(0.1, 0.5))])
+        got = self.gallery.match_employees_batch([self.probe], tolerance=0.6, strategy="vote", min_votes=1)
+        self.assertMatches(got[0], [(10, 0.1), (20, np.hypot(0.1, 0.5))])
+
+    def test_one_sorted_list_per_probe(self):
+        probes = [self.probe, vec(1, 0.45), vec(3, 5.0)]
+        got = self.gallery.match_employees_batch(probes, tolerance=0.6)
+        self.assertEqual(len(got), 3)
+        self.assertMatches(got[1], [(20, 0.05), (10, 0.45)])
+        self.assertEqual(got[2], [])
+        for probe, batch in zip(probes, got):
+            self.assertEqual(self.gallery.match_employees(probe, tolerance=0.6), batch)
+
+    def test_photos_without_legajo_are_not_employees(self):
+        # La foto sin legajo es la más cercana (distancia 0) pero no cuenta como empleado
+        got = self.gallery.match_employees_batch([vec(2, 0.05)], tolerance=0.3)
+        self.assertMatches(got[0], [(10, 0.05)])
+        self.assertEqual(self.gallery.search(vec(2, 0.05), tolerance=0.01)[0][0], "sin_legajo.jpg")
+
+    def test_edge_cases(self):
+        self.assertEqual(self.gallery.match_employees_batch([]), [])
+        self.assertEqual(GalleryIndex().match_employees_batch([self.probe]), [[]])
+        with self.assertRaises(ValueError):
+            self.gallery.match_employees_batch([self.probe], strategy="mediana")
+
+
+if __name__ == "__main__":
+    unittest.main()
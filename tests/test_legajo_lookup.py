@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from src import utils_db
+
+
+class TestLegajoLookup(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pyme.db")
+        utils_db.ensure_db_seeded(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        utils_db.add_face_mapping(self.conn.cursor(), "foto.jpg", 5)
+        self.conn.commit()
+        self.lookups = []
+
+    def tearDown(self):
+        for lookup in self.lookups:
+            lookup.close()
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def lookup(self, check_interval):
+        lookup = utils_db.LegajoLookup(self.db_path, check_interval=check_interval)
+        self.lookups.append(lookup)
+        return lookup
+
+    def write_raw(self, archivo, legajo):
+        # Como otro proceso: no pasa por add_face_mapping, no sube la generación
+        self.conn.execute('INSERT OR REPLACE INTO rostros (archivo, legajo) VALUES (?, ?)', (archivo, legajo))
+        self.conn.commit()
+
+    def test_loads_once_and_skips_numeric_names(self):
+        lookup = self.lookup(check_interval=3600)
+        with mock.patch.object(utils_db, "get_face_mappings", wraps=utils_db.get_face_mappings) as load:
+            self.assertEqual(lookup("foto.jpg"), 5)
+            self.assertIsNone(lookup("otra.jpg"))
+            self.assertEqual(lookup("12.jpg"), 12)
+        self.assertEqual(load.call_count, 1)
+
+    def test_mapping_written_by_this_process_is_seen_at_once(self):
+        lookup = self.lookup(check_interval=3600)
+        self.assertIsNone(lookup("nueva.jpg"))
+        utils_db.add_face_mapping(self.conn.cursor(), "nueva.jpg", 6)
+        self.conn.commit()
+        self.assertEqual(lookup("nueva.jpg"), 6)
+        utils_db.set_face_mapping_bulk(self.conn.cursor(), [("nueva.jpg", 7), ("foto.jpg", 8)])
+        self.conn.commit()
+        self.assertEqual((lookup("nueva.jpg"), lookup("foto.jpg")), (7, 8))
+
+    def test_other_writers_wait_for_the_interval_or_invalidate(self):
+        lookup = self.lookup(check_interval=3600)
+        self.assertEqual(lookup("foto.jpg"), 5)
+        self.write_raw("foto.jpg", 9)
+        self.assertEqual(lookup("foto.jpg"), 5)
+        lookup.invalidate()
+        self.assertEqual(lookup("foto.jpg"), 9)
+
+    def test_data_version_detects_other_connections(self):
+        lookup = self.lookup(check_interval=0)
+        self.assertEqual(lookup("foto.jpg"), 5)
+        with mock.patch.object(utils_db, "get_face_mappings", wraps=utils_db.get_face_mappings) as load:
+            self.assertEqual(lookup("foto.jpg"), 5)
+            load.assert_not_called()  # data_version sin cambios: no se recarga
+            self.write_raw("foto.jpg", 9)
+            self.assertEqual(lookup("foto.jpg"), 9)
+        self.assertEqual(load.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
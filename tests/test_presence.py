@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+
+from src.presence import PresenceManager
+
+
+class TestPresenceManager(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.pm = self.make()
+
+    def make(self, **kwargs):
+        return PresenceManager(on_event=lambda evento, legajo, t: self.events.append((evento, legajo, t)),
+                               disappear_seconds=10, cooldown_seconds=30, **kwargs)
+
+    def test_one_entrada_per_legajo_and_frame(self):
+        self.pm.detections([7, 8, 7], 100.0)
+        self.assertEqual(self.events, [("entrada", 7, 100.0), ("entrada", 8, 100.0)])
+        self.pm.detections([7], 101.0)
+        self.assertEqual(len(self.events), 2)
+        self.assertEqual(sorted(self.pm.present()), [7, 8])
+
+    def test_tick_emits_salida_at_last_seen(self):
+        self.pm.detections([7, 8], 100.0)
+        self.pm.detections([7], 105.0)
+        self.assertEqual(self.pm.tick(120.0), 0)  # todavía dentro del cooldown de la entrada
+        self.assertEqual(self.pm.tick(130.0), 2)
+        self.assertEqual(self.events[2:], [("salida", 7, 105.0), ("salida", 8, 100.0)])
+        self.assertEqual(self.pm.present(), [])
+        self.assertEqual(self.pm.tick(200.0), 0)
+
+    def test_cooldown_after_salida(self):
+        self.pm.detections([7], 100.0)
+        self.pm.tick(130.0)
+        self.pm.detections([7], 120.0)  # llegó tarde: dentro del cooldown de la salida (t=100)
+        self.pm.detections([7], 131.0)
+        self.assertEqual(self.events, [("entrada", 7, 100.0), ("salida", 7, 100.0), ("entrada", 7, 131.0)])
+
+    def test_expired_without_tick_emits_salida_before_entrada(self):
+        self.pm.detections([7], 100.0)
+        self.pm.detections([7], 200.0)
+        self.assertEqual(self.events, [("entrada", 7, 100.0), ("salida", 7, 100.0), ("entrada", 7, 200.0)])
+
+    def test_tick_limits_expirations_oldest_first(self):
+        pm = self.make(max_expirations_per_tick=2)
+        for legajo, t in ((1, 103.0), (2, 100.0), (3, 102.0)):
+            pm.detections([legajo], t)
+        pm.detections([1, 2, 3], 125.0)
+        pm.detections([1], 128.0)
+        self.events.clear()
+        # vencimientos: 2 -> 135 (cooldown 100+30), 3 -> 135 (visto a los 125), 1 -> 138
+        self.assertEqual(pm.tick(140.0), 2)
+        self.assertEqual(self.events, [("salida", 2, 125.0), ("salida", 3, 125.0)])
+        self.assertEqual(pm.tick(140.0), 1)
+        self.assertEqual(self.events[-1], ("salida", 1, 128.0))
+
+    def test_uses_now_provider_without_timestamps(self):
+        now = [50.0]
+        pm = PresenceManager(on_event=lambda *e: self.events.append(e), disappear_seconds=10,
+                             cooldown_seconds=0, now_provider=lambda: now[0])
+        pm.detection(4)
+        now[0] = 61.0
+        self.assertEqual(pm.tick(), 1)
+        self.assertEqual(self.events, [("entrada", 4, 50.0), ("salida", 4, 50.0)])
+
+    def test_grows_past_capacity(self):
+        pm = self.make(capacity=2)
+        pm.detections(range(10), 0.0)
+        self.assertEqual(sorted(pm.present()), list(range(10)))
+        self.assertEqual(pm.tick(30.0), 10)
+
+
+class TestWarmStartAndSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.pm = PresenceManager(on_event=lambda *e: self.events.append(e), disappear_seconds=10,
+                                  cooldown_seconds=30)
+
+    def test_warm_track_not_seen_is_dropped_without_salida(self):
+        self.assertEqual(self.pm.warm_start({5: 1000.0}, t=5000.0), 1)
+        self.assertEqual(self.pm.present(), [5])
+        self.assertEqual(self.pm.tick(5011.0), 0)
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.pm.present(), [])
+        # El turno sigue abierto en la DB: el próximo avistamiento emite la entrada (el writer la
+        # ignora) y su salida cierra el turno con una hora real
+        self.pm.detections([5], 5020.0)
+        self.pm.tick(5060.0)
+        self.assertEqual(self.events, [("entrada", 5, 5020.0), ("salida", 5, 5020.0)])
+
+    def test_warm_track_seen_keeps_the_shift_without_a_new_entrada(self):
+        self.pm.warm_start({5: 1000.0}, t=5000.0)
+        self.pm.detections([5], 5005.0)
+        self.assertFalse(self.pm.get_state(5).warm)
+        self.assertEqual(self.pm.tick(5016.0), 1)
+        self.assertEqual(self.events, [("salida", 5, 5005.0)])
+
+    def test_warm_start_skips_legajos_already_present(self):
+        self.pm.detections([5], 100.0)
+        self.assertEqual(self.pm.warm_start({5: 50.0, 6: 50.0}, t=101.0), 1)
+        self.assertFalse(self.pm.get_state(5).warm)
+        self.assertTrue(self.pm.get_state(6).warm)
+
+    def test_snapshot_round_trip(self):
+        self.pm.detections([8], 100.0)
+        self.pm.detections([7], 120.0)
+        self.pm.detections([7], 124.0)
+        self.pm.tick(131.0)  # 8 sale a los 100; 7 sigue presente hasta 150
+        self.pm.warm_start({9: 90.0}, t=131.0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "presence.npz")
+            self.pm.save_snapshot(path)
+            restored = PresenceManager(on_event=lambda *e: self.events.append(e), disappear_seconds=10,
+                                       cooldown_seconds=30, capacity=1)
+            self.assertTrue(restored.load_snapshot(path))
+        for legajo in (7, 8, 9):
+            self.assertEqual(restored.get_state(legajo), self.pm.get_state(legajo))
+        self.assertEqual(sorted(restored.present()), [7, 9])
+        del self.events[:]
+        restored.tick(200.0)
+        self.assertEqual(self.events, [("salida", 7, 124.0)])
+
+    def test_missing_or_corrupt_snapshot_leaves_the_table_empty(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "presence.npz")
+            self.assertFalse(self.pm.load_snapshot(path))
+            with open(path, "wb") as f:
+                f.write(b"no es un npz")
+            with self.assertLogs("presence", "WARNING"):
+                self.assertFalse(self.pm.load_snapshot(path))
+        self.assertEqual(self.pm.present(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
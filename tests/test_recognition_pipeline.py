@@ -0,0 +1,193 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import recognition_pipeline as rp
+from src.utils_recognition import GalleryIndex
+
+
+def vec(axis, scale=1.0):
+    v = np.zeros(128, dtype=np.float32)
+    v[axis] = scale
+    return v
+
+
+class FakeTracker:
+    # Mueve la caja dx píxeles por frame; lost=True simula que el tracker perdió la cara
+    def __init__(self, dx=1):
+        self.dx = dx
+        self.lost = False
+        self.xywh = None
+
+    def init(self, small, xywh):
+        self.xywh = xywh
+        return True
+
+    def update(self, small):
+        if self.lost:
+            return False, None
+        x, y, w, h = self.xywh
+        self.xywh = (x + self.dx, y, w, h)
+        return True, self.xywh
+
+
+class FrameRecognizerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.frame = np.zeros((400, 400, 3), dtype=np.uint8)  # reducido: 100x100
+        self.gallery = GalleryIndex([vec(1), vec(2)], ["1.jpg", "2.jpg"], [1, 2])
+        self.boxes = []  # lo que "detecta" HOG en el próximo keyframe
+        self.encodings = {}  # left de la caja -> encoding
+        self.trackers = []
+        patches = [
+            mock.patch.object(rp, "detect_faces", side_effect=lambda small, detector=None: list(self.boxes)),
+            mock.patch.object(rp, "encode_faces", side_effect=self.encode),
+            mock.patch.object(rp, "make_tracker", side_effect=self.make_tracker),
+        ]
+        self.detect, self.encoded, _ = (p.start() for p in patches)
+        for p in patches:
+            self.addCleanup(p.stop)
+
+    def encode(self, small, boxes):
+        return [self.encodings[min(self.encodings, key=lambda left: abs(left - box[3]))] for box in boxes]
+
+    def make_tracker(self, kind):
+        tracker = FakeTracker()
+        self.trackers.append(tracker)
+        return tracker
+
+    def recognizer(self, **kwargs):
+        return rp.FrameRecognizer(self.gallery, **kwargs)
+
+
+class TestFrameRecognizerTracking(FrameRecognizerTestCase):
+    def test_recognized_face_is_followed_without_reencoding(self):
+        self.boxes = [(10, 30, 30, 10)]
+        self.encodings = {10: vec(1)}
+        rec = self.recognizer(keyframe_interval=1.0)
+        first = rec.process(self.frame, 1, 0.0)
+        self.assertEqual([leg for leg, _ in first.matches], [1])
+        self.assertEqual(first.boxes, [(40, 120, 120, 40)])  # escalado al frame original
+        for i, t in enumerate((0.2, 0.4), start=2):
+            result = rec.process(self.frame, i, t)
+            self.assertEqual(result.present, [1])
+            self.assertFalse(result.encoded)
+        self.assertEqual(result.boxes, [(40, 128, 120, 48)])  # el tracker movió la caja 2 px
+        self.assertEqual((self.detect.call_count, self.encoded.call_count), (1, 1))
+        # Keyframe: la detección se asocia al mismo track por solapamiento y no se recodifica
+        self.boxes = [(10, 32, 30, 12)]
+        result = rec.process(self.frame, 4, 1.0)
+        self.assertEqual((self.detect.call_count, self.encoded.call_count), (2, 1))
+        self.assertEqual((rec.keyframes, result.present), (2, [1]))
+
+    def test_unknown_face_is_retried_up_to_max_attempts(self):
+        self.boxes = [(10, 30, 30, 10)]
+        self.encodings = {10: vec(5)}
+        rec = self.recognizer(max_attempts=3)
+        for i in range(5):
+            result = rec.process(self.frame, i, i * 0.1)
+            self.assertTrue(result.face_found)
+            self.assertEqual(result.present, [])
+        self.assertEqual(self.encoded.call_count, 3)
+        self.assertTrue(rec.tracks[0].settled)
+
+    def test_lost_tracker_forces_a_keyframe(self):
+        self.boxes = [(10, 30, 30, 10)]
+        self.encodings = {10: vec(1)}
+        rec = self.recognizer(keyframe_interval=10.0)
+        rec.process(self.frame, 1, 0.0)
+        self.trackers[-1].lost = True
+        result = rec.process(self.frame, 2, 0.1)
+        self.assertEqual(result.present, [1])  # conserva la última caja hasta la próxima detección
+        self.assertEqual(self.detect.call_count, 1)
+        self.boxes = []
+        result = rec.process(self.frame, 3, 0.2)
+        self.assertEqual(self.detect.call_count, 2)
+        self.assertFalse(result.face_found)
+
+    def test_two_faces_cannot_be_the_same_legajo(self):
+        self.boxes = [(10, 30, 30, 10), (10, 80, 30, 60)]
+        self.encodings = {10: vec(1, 0.9), 60: vec(1)}
+        rec = self.recognizer(max_attempts=3)
+        result = rec.process(self.frame, 1, 0.0)
+        self.assertEqual(result.box_legajos, [[], [1]])
+        self.assertFalse(rec.tracks[0].settled)
+        # La cara que perdió vuelve a codificarse; ahora sí se parece a 2
+        self.encodings[10] = vec(2)
+        result = rec.process(self.frame, 2, 0.1)
+        self.assertEqual(self.encoded.call_args[0][1], [rec.tracks[0].box])
+        self.assertEqual(result.box_legajos, [[2], [1]])
+
+    def test_without_tracker_detects_every_frame(self):
+        self.boxes = [(10, 30, 30, 10)]
+        self.encodings = {10: vec(1)}
+        rec = self.recognizer(tracker=None)
+        for i in range(3):
+            self.assertEqual(rec.process(self.frame, i, i * 0.1).present, [1])
+        self.assertEqual((self.detect.call_count, self.encoded.call_count), (3, 1))
+        self.assertEqual(self.trackers, [])
+
+
+class TestMotionGate(unittest.TestCase):
+    def setUp(self):
+        self.still = np.full((240, 320, 3), 100, dtype=np.uint8)
+        self.moved = self.still.copy()
+        self.moved[60:180, 200:300] = 250  # algo entró por la derecha
+
+    def test_diff_compares_with_the_previous_frame(self):
+        gate = rp.MotionGate(method="diff")
+        self.assertTrue(gate.changed(self.still))  # sin frame anterior
+        self.assertFalse(gate.changed(self.still))
+        self.assertEqual(gate.level, 0.0)
+        self.assertTrue(gate.changed(self.moved))
+        self.assertGreater(gate.level, 0.1)
+
+    def test_changes_outside_the_roi_are_ignored(self):
+        gate = rp.MotionGate(method="diff", roi=rp.parse_roi("0,0,0.5,1"))
+        gate.changed(self.still)
+        self.assertFalse(gate.changed(self.moved))
+        gate = rp.MotionGate(method="diff", roi=rp.parse_roi("0.5,0,1,1"))
+        gate.changed(self.still)
+        self.assertTrue(gate.changed(self.moved))
+
+    def test_mog2_learns_the_background(self):
+        gate = rp.MotionGate(method="mog2")
+        for _ in range(5):
+            gate.changed(self.still)
+        self.assertFalse(gate.changed(self.still))
+        self.assertTrue(gate.changed(self.moved))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            rp.MotionGate(method="optical-flow")
+        for text in ("0,0,1", "0.5,0,0.2,1", "0,0,1,1.5"):
+            with self.assertRaises(ValueError):
+                rp.parse_roi(text)
+        self.assertIsNone(rp.parse_roi(""))
+
+
+class TestMotionGatedRecognizer(FrameRecognizerTestCase):
+    def test_still_scene_skips_detection_until_idle_interval(self):
+        gate = rp.MotionGate(method="diff")
+        rec = self.recognizer(motion_gate=gate, idle_detect_interval=5.0)
+        rec.process(self.frame, 1, 0.0)  # primer frame: cuenta como movimiento
+        self.assertEqual(self.detect.call_count, 1)
+        for i in range(2, 5):
+            result = rec.process(self.frame, i, float(i))
+            self.assertFalse(result.motion)
+        self.assertEqual((self.detect.call_count, rec.gated), (1, 3))
+        rec.process(self.frame, 5, 5.0)  # nadie se movió, pero se detecta igual cada 5 s
+        self.assertEqual(self.detect.call_count, 2)
+
+    def test_tracked_faces_are_followed_without_motion(self):
+        self.boxes = [(10, 30, 30, 10)]
+        self.encodings = {10: vec(1)}
+        rec = self.recognizer(motion_gate=rp.MotionGate(method="diff"))
+        rec.process(self.frame, 1, 0.0)
+        result = rec.process(self.frame, 2, 0.1)
+        self.assertFalse(result.motion)
+        self.assertEqual((result.present, rec.gated), ([1], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import sync_supabase
+from src import utils_db
+from src.sync_uploader import AdaptiveBatchSize, BatchUploader
+
+
+class Rejected(Exception):
+    code = "23503"  # FK: no se arregla reintentando
+
+
+class RejectingTarget(sync_supabase.MemoryTarget):
+    # Rechaza los lotes que traen alguna fila para la que reject(table, row) es verdadero
+    def __init__(self, reject):
+        super().__init__()
+        self.reject = reject
+
+    def upsert(self, table, rows, on_conflict):
+        if any(self.reject(table, row) for row in rows):
+            raise Rejected(f"{table}: lote rechazado")
+        super().upsert(table, rows, on_conflict)
+
+
+def one_row_batches(target):
+    # Un lote por fila: los acks quedan por fila y no por lote
+    return BatchUploader(target, workers=2, retries=0, sleep=lambda d: None,
+                         batch_size=AdaptiveBatchSize(initial=1, minimum=1, maximum=1))
+
+
+class TestSyncOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pyme.db")
+        utils_db.ensure_db_seeded(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        cur = self.conn.cursor()
+        for legajo in (1, 2, 3):
+            utils_db.report_empleado_entrada(cur, legajo, "2026-01-05 08:00:00")
+        self.conn.commit()
+        self.empleados = cur.execute("SELECT COUNT(*) FROM empleados").fetchone()[0]
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def outbox(self):
+        return self.conn.execute("SELECT tabla, clave FROM sync_outbox ORDER BY id").fetchall()
+
+    def test_keeps_only_the_rows_the_server_did_not_ack(self):
+        target = RejectingTarget(lambda table, row: table == "asistencia_empleado" and row["legajo_empleado"] == 2)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            totals = sync_supabase.sync_outbox(self.conn, one_row_batches(target))
+
+        self.assertEqual(totals["empleados"].sent, self.empleados)
+        self.assertEqual((totals["asistencia_empleado"].sent, totals["asistencia_empleado"].failed), (2, 1))
+        pendiente = self.conn.execute(
+            "SELECT id FROM asistencia_empleado WHERE legajo_empleado = 2").fetchone()[0]
+        self.assertEqual(self.outbox(), [("asistencia_empleado", pendiente)])
+        self.assertEqual(len(target.tables["asistencia_empleado"]), 2)
+
+        # Watermarks: empleados quedó al día; asistencias justo antes de la entrada pendiente
+        state = utils_db.get_sync_state(self.conn.cursor())
+        entry_id = self.conn.execute("SELECT id FROM sync_outbox").fetchone()[0]
+        self.assertEqual(state["asistencia_empleado"][0], entry_id - 1)
+        self.assertGreaterEqual(state["empleados"][0], entry_id)
+
+        # El próximo sync sube sólo lo que quedó
+        target = sync_supabase.MemoryTarget()
+        totals = sync_supabase.sync_outbox(self.conn, one_row_batches(target))
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(totals["asistencia_empleado"].sent, 1)
+        self.assertEqual(set(target.tables), {"asistencia_empleado"})
+
+    def test_failed_parent_blocks_only_its_own_rows(self):
+        target = RejectingTarget(lambda table, row: table == "empleados" and row["legajo"] == 1)
+        uploader = BatchUploader(target, workers=2, retries=0, sleep=lambda d: None,
+                                 batch_size=AdaptiveBatchSize(initial=500))
+        with self.assertLogs("sync_uploader", "WARNING"):
+            totals = sync_supabase.sync_outbox(self.conn, uploader)
+
+        # El lote de empleados se parte hasta aislar al legajo 1; sólo su asistencia queda esperando
+        self.assertEqual((totals["empleados"].sent, totals["empleados"].failed), (self.empleados - 1, 1))
+        self.assertEqual((totals["asistencia_empleado"].sent, totals["asistencia_empleado"].skipped), (2, 1))
+        self.assertEqual({fila["legajo_empleado"] for fila in target.tables["asistencia_empleado"].values()}, {2, 3})
+        self.assertEqual(self.outbox(), [("empleados", 1), ("asistencia_empleado", 1)])
+
+    def test_later_outbox_batches_still_drain_after_a_failure(self):
+        target = RejectingTarget(lambda table, row: table == "empleados" and row["legajo"] == 1)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            sync_supabase.sync_outbox(self.conn, one_row_batches(target), batch_size=2)
+        self.assertEqual(self.outbox(), [("empleados", 1), ("asistencia_empleado", 1)])
+
+    def test_stops_when_nothing_goes_through(self):
+        target = RejectingTarget(lambda table, row: True)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            totals = sync_supabase.sync_outbox(self.conn, one_row_batches(target), batch_size=2)
+        self.assertEqual(totals["empleados"].failed, 2)
+        self.assertEqual(len(self.outbox()), self.empleados + 3)
+
+    def test_full_sync_uploads_children_of_good_parents(self):
+        target = RejectingTarget(lambda table, row: table == "empleados" and row["legajo"] == 1)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            totals = sync_supabase.sync_full(self.conn, one_row_batches(target))
+        self.assertEqual((totals["asistencia_empleado"].sent, totals["asistencia_empleado"].skipped), (2, 1))
+        # Algo no se subió: el outbox no se da por cubierto
+        self.assertEqual(len(self.outbox()), self.empleados + 3)
+
+    def test_dry_run_does_not_touch_the_outbox(self):
+        antes = self.outbox()
+        sync_supabase.sync_outbox(self.conn, one_row_batches(sync_supabase.MemoryTarget()), advance=False)
+        self.assertEqual(self.outbox(), antes)
+
+    def test_rows_changed_again_are_sent_once_with_their_current_state(self):
+        self.conn.execute("UPDATE asistencia_empleado SET salida = '2026-01-05 17:00:00' WHERE legajo_empleado = 1")
+        self.conn.commit()
+        target = sync_supabase.MemoryTarget()
+        totals = sync_supabase.sync_outbox(self.conn, one_row_batches(target))
+        self.assertEqual(totals["asistencia_empleado"].sent, 3)
+        fila = target.tables["asistencia_empleado"][(1, "2026-01-05 08:00:00")]
+        self.assertEqual(fila["salida"], "2026-01-05 17:00:00")
+        self.assertEqual(self.outbox(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
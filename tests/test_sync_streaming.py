@@ -0,0 +1,77 @@
+import math
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import sync_supabase
+from src import utils_db
+
+
+class TestIterTableRows(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pyme.db")
+        utils_db.ensure_db_seeded(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.legajos = [r[0] for r in self.conn.execute('SELECT legajo FROM empleados ORDER BY legajo')]
+        self.queries = []
+        self.conn.set_trace_callback(self.queries.append)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_pages_by_key(self):
+        rows = list(utils_db.iter_table_rows(self.conn, "empleados", "nombre, puesto", page=5))
+        self.assertEqual([row["_clave"] for row in rows], self.legajos)
+        self.assertEqual(rows[0].keys(), ["_clave", "nombre", "puesto"])
+        # Una consulta por página más la que vuelve vacía; las siguientes arrancan después de la última clave
+        self.assertEqual(len(self.queries), math.ceil(len(self.legajos) / 5) + 1)
+        self.assertIn(f"WHERE legajo > {self.legajos[4]}", self.queries[1])
+
+    def test_is_lazy(self):
+        rows = utils_db.iter_table_rows(self.conn, "empleados", "nombre", page=5)
+        for _ in range(5):
+            next(rows)
+        self.assertEqual(len(self.queries), 1)
+        rows.close()
+
+    def test_writers_are_not_blocked_and_new_keys_are_seen(self):
+        writer = sqlite3.connect(self.db_path, timeout=0.1)
+        self.addCleanup(writer.close)
+        seen = []
+        for row in utils_db.iter_table_rows(self.conn, "empleados", "nombre", page=5):
+            seen.append(row["_clave"])
+            if len(seen) == 1:
+                writer.execute('INSERT INTO empleados (legajo, nombre, puesto, area) VALUES (?, ?, ?, ?)',
+                               (max(self.legajos) + 1, "Nueva", "Operaria", "Planta"))
+                writer.commit()
+        self.assertEqual(seen, self.legajos + [max(self.legajos) + 1])
+
+    def test_empty_table(self):
+        self.conn.execute('DELETE FROM rostros')
+        self.assertEqual(list(utils_db.iter_table_rows(self.conn, "rostros", "legajo")), [])
+
+
+class TestChunked(unittest.TestCase):
+    def test_generator_is_split_without_materializing_it(self):
+        pulled = []
+
+        def rows():
+            for i in range(7):
+                pulled.append(i)
+                yield i
+
+        chunks = sync_supabase.chunked(rows(), 3)
+        self.assertEqual(next(chunks), [0, 1, 2])
+        self.assertEqual(pulled, [0, 1, 2])
+        self.assertEqual(list(chunks), [[3, 4, 5], [6]])
+
+    def test_empty_and_exact_sizes(self):
+        self.assertEqual(list(sync_supabase.chunked(iter(()), 3)), [])
+        self.assertEqual(list(sync_supabase.chunked(range(6), 3)), [[0, 1, 2], [3, 4, 5]])
+
+
+if __name__ == "__main__":
+    unittest.main()
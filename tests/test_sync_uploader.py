@@ -0,0 +1,135 @@
+import unittest
+
+from src.sync_uploader import AdaptiveBatchSize, BatchUploader, UploadJob, is_retryable
+
+
+class UploadError(Exception):
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class FlakyTarget:
+    # Falla las primeras `failures` llamadas de cada tabla con `code`; después acepta. Los lotes que
+    # traen alguna fila de `bad` ({tabla: ids}) se rechazan siempre con 409.
+    def __init__(self, failures=None, code=503, bad=None):
+        self.failures = dict(failures or {})
+        self.code = code
+        self.bad = bad or {}
+        self.calls = []
+
+    def upsert(self, table, rows, on_conflict):
+        self.calls.append((table, len(rows)))
+        if self.failures.get(table, 0) > 0:
+            self.failures[table] -= 1
+            raise UploadError(self.code)
+        if any(row["id"] in self.bad.get(table, ()) for row in rows):
+            raise UploadError(409)
+
+
+def job(table, n, parents=None):
+    # Fila i con FK al padre i % 5
+    return UploadJob(table, "id", [(i, {"id": i, "padre": i % 5}) for i in range(n)],
+                     {"empleados": "padre"} if parents else parents)
+
+
+def make_uploader(target, retries=3, workers=2):
+    delays = []
+    uploader = BatchUploader(target, workers=workers, retries=retries, sleep=delays.append,
+                             batch_size=AdaptiveBatchSize(initial=10, minimum=10, maximum=10))
+    return uploader, delays
+
+
+class TestBatchUploader(unittest.TestCase):
+    def test_retries_until_the_batch_goes_through(self):
+        target = FlakyTarget({"empleados": 2})
+        uploader, delays = make_uploader(target)
+        st = uploader.upload([[job("empleados", 5)]])["empleados"]
+        self.assertEqual((st.sent, st.failed, st.retries, st.batches), (5, 0, 2, 1))
+        self.assertEqual(sorted(st.acked), list(range(5)))
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= uploader.base_delay)
+        self.assertTrue(0 <= delays[1] <= uploader.base_delay * 2)
+
+    def test_gives_up_after_the_last_retry(self):
+        target = FlakyTarget({"empleados": 10})
+        uploader, delays = make_uploader(target, retries=3)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            st = uploader.upload([[job("empleados", 5)]])["empleados"]
+        self.assertEqual((st.sent, st.failed, st.retries), (0, 5, 3))
+        self.assertEqual(st.acked, [])
+        self.assertEqual(sorted(st.rejected), list(range(5)))
+        self.assertEqual(len(target.calls), 4)
+
+    def test_client_errors_are_not_retried(self):
+        target = FlakyTarget(bad={"empleados": {0}})
+        uploader, delays = make_uploader(target)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            st = uploader.upload([[job("empleados", 1)]])["empleados"]
+        self.assertEqual((st.sent, st.failed, st.retries, st.rejected), (0, 1, 0, [0]))
+        self.assertEqual(delays, [])
+
+    def test_rejected_batch_is_split_to_isolate_bad_rows(self):
+        target = FlakyTarget(bad={"empleados": {3, 17}})
+        uploader, delays = make_uploader(target)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            st = uploader.upload([[job("empleados", 25)]])["empleados"]
+        self.assertEqual((st.sent, st.failed, st.retries), (23, 2, 0))
+        self.assertEqual(sorted(st.rejected), [3, 17])
+        self.assertEqual(sorted(st.acked), [i for i in range(25) if i not in (3, 17)])
+        self.assertEqual(delays, [])
+
+    def test_skips_only_children_of_failed_parents(self):
+        target = FlakyTarget(bad={"empleados": {2}})
+        uploader, _ = make_uploader(target)
+        missing = {}
+        with self.assertLogs("sync_uploader", "WARNING"):
+            stats = uploader.upload([[job("empleados", 5, parents={})],
+                                     [job("rostros", 4, parents=True), job("asistencia_empleado", 12, parents=True)]],
+                                    missing)
+        self.assertEqual((stats["empleados"].sent, stats["empleados"].failed), (4, 1))
+        self.assertEqual((stats["rostros"].sent, stats["rostros"].skipped), (3, 1))
+        self.assertEqual((stats["asistencia_empleado"].sent, stats["asistencia_empleado"].skipped), (10, 2))
+        self.assertEqual(missing, {"empleados": {2}, "rostros": {2}, "asistencia_empleado": {2, 7}})
+
+        # Una llamada siguiente con el mismo missing sigue salteando a los hijos del padre fallido
+        stats = uploader.upload([[job("asistencia_empleado", 3, parents=True)]], missing)
+        self.assertEqual((stats["asistencia_empleado"].sent, stats["asistencia_empleado"].skipped), (2, 1))
+
+    def test_jobs_without_parents_skip_entirely_after_a_failure(self):
+        target = FlakyTarget({"empleados": 1}, code=409)
+        uploader, _ = make_uploader(target, workers=1)
+        with self.assertLogs("sync_uploader", "WARNING"):
+            stats = uploader.upload([[job("empleados", 1)], [job("rostros", 4), job("asistencia_empleado", 6)]])
+        self.assertEqual(stats["empleados"].failed, 1)
+        self.assertEqual((stats["rostros"].skipped, stats["asistencia_empleado"].skipped), (4, 6))
+        self.assertEqual({table for table, _ in target.calls}, {"empleados"})
+
+    def test_stages_run_in_order(self):
+        target = FlakyTarget()
+        uploader, _ = make_uploader(target)
+        stats = uploader.upload([[job("empleados", 12)], [job("rostros", 3), job("asistencia_empleado", 0)]])
+        self.assertEqual([table for table, _ in target.calls], ["empleados", "empleados", "rostros"])
+        self.assertEqual((stats["empleados"].sent, stats["rostros"].sent, stats["asistencia_empleado"].sent), (12, 3, 0))
+
+
+class TestIsRetryable(unittest.TestCase):
+    def test_http_status(self):
+        for code in (408, 429, 500, 503):
+            self.assertTrue(is_retryable(UploadError(code)), code)
+        for code in (400, 401, 404, 409):
+            self.assertFalse(is_retryable(UploadError(code)), code)
+
+    def test_postgres_and_postgrest_codes(self):
+        for code in ("23503", "23505", "22P02", "42501", "PGRST204", "PGRST301"):
+            self.assertFalse(is_retryable(UploadError(code)), code)
+        for code in ("40001", "57014", "53300", "PGRST000", "PGRST003"):
+            self.assertTrue(is_retryable(UploadError(code)), code)
+
+    def test_network_errors(self):
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertTrue(is_retryable(TimeoutError()))
+
+
+if __name__ == "__main__":
+    unittest.main()